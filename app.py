@@ -1,16 +1,26 @@
-from flask import Flask, abort, request, redirect, render_template, session, url_for, jsonify
-from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
+from flask import (Flask, Response, abort, request, redirect, render_template, session, url_for, jsonify,
+                   send_from_directory, stream_with_context)
+from werkzeug.security import generate_password_hash, check_password_hash, safe_join
 from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_wtf.csrf import CSRFProtect
 from datetime import datetime, timezone, timedelta
 from dotenv import load_dotenv
 from openai import OpenAI
-import stripe, os, re, base64, json, smtplib
+from PIL import Image, ImageOps
+from concurrent.futures import ThreadPoolExecutor, wait
+from collections import OrderedDict
+import stripe, os, re, base64, json, smtplib, threading, uuid, hashlib, time, copy, io, math, gzip, mimetypes
+import click
 from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
 from email.message import EmailMessage
-from sqlalchemy import and_, or_
-from models import db, User, FriendRequest, Transaction, Group, GroupMember, GroupInvite
+from sqlalchemy import (and_, or_, bindparam, delete, exists, func, insert, literal, select, text, tuple_, union_all,
+                        update, String)
+from sqlalchemy.exc import IntegrityError
+from splits import SplitError, item_shares, settle_up, split_bills
+from user_index import UserPrefixIndex
+from models import (db, User, friendships, FriendRequest, Transaction, Group, GroupMember, GroupInvite, Notification,
+                    ReceiptScanJob, UserTotals, TransactionItem, TransactionItemOwner, GroupBalance, GroupLedgerEntry,
+                    FriendSuggestion)
 from flask_migrate import Migrate
 
 
@@ -20,6 +30,7 @@ load_dotenv(os.getenv("ENV_FILE") or None, override=True)
 
 # Keys and Configs
 OPENAI_API_KEY       = (os.getenv("OPENAI_API_KEY") or "").strip()
+OPENAI_BASE_URL      = (os.getenv("OPENAI_BASE_URL") or "").strip() or None   # point at fake_openai.py for load tests
 STRIPE_SECRET_KEY    = os.getenv("STRIPE_SECRET_KEY")
 STRIPE_PUBLISHABLE   = os.getenv("STRIPE_PUBLISHABLE_KEY")
 endpoint_secret      = os.getenv("STRIPE_WEBHOOK_SECRET")
@@ -33,8 +44,73 @@ MAIL_USERNAME       = os.getenv("MAIL_USERNAME")
 MAIL_PASSWORD       = os.getenv("MAIL_PASSWORD")
 MAIL_DEFAULT_SENDER = os.getenv("MAIL_DEFAULT_SENDER") or MAIL_USERNAME
 
+# Receipt scanning: "sync" keeps the old blocking behaviour, "async" queues scans as jobs
+RECEIPT_SCAN_MODE        = (os.getenv("RECEIPT_SCAN_MODE") or "sync").strip().lower()
+RECEIPT_SCAN_WORKERS     = int(os.getenv("RECEIPT_SCAN_WORKERS") or 4)
+RECEIPT_SCAN_MAX_PENDING = int(os.getenv("RECEIPT_SCAN_MAX_PENDING") or 32)
+RECEIPT_SCAN_TIMEOUT     = float(os.getenv("RECEIPT_SCAN_TIMEOUT") or 60)   # seconds per OpenAI call
+RECEIPT_BATCH_WORKERS    = int(os.getenv("RECEIPT_BATCH_WORKERS") or 6)
+RECEIPT_BATCH_MAX        = int(os.getenv("RECEIPT_BATCH_MAX") or 20)
+# The upload form streams items as they're parsed (/upload_receipt/stream) only when this is on.
+# A stream holds its web worker for the whole OpenAI call, so enable it only with threaded or
+# gevent workers (gunicorn --worker-class gthread/gevent); otherwise uploads go through async jobs.
+RECEIPT_STREAM_UPLOADS   = os.getenv("RECEIPT_STREAM_UPLOADS", "False").strip().lower() == "true"
+
+# Parsed-receipt cache (keyed by image hash). Hits are free unless RECEIPT_CACHE_CHARGE_HITS=true
+RECEIPT_CACHE_SIZE        = int(os.getenv("RECEIPT_CACHE_SIZE") or 512)
+RECEIPT_CACHE_TTL         = int(os.getenv("RECEIPT_CACHE_TTL") or 24 * 3600)
+RECEIPT_CACHE_CHARGE_HITS = os.getenv("RECEIPT_CACHE_CHARGE_HITS", "False").strip().lower() == "true"
+
+# Receipt image preprocessing before the vision call. gpt-4o (detail=high) fits images
+# into 2048x2048 and then scales the short side to 768, so anything bigger is wasted upload.
+RECEIPT_IMAGE_PREPROCESS = os.getenv("RECEIPT_IMAGE_PREPROCESS", "True").strip().lower() == "true"
+RECEIPT_IMAGE_MAX_SIDE   = int(os.getenv("RECEIPT_IMAGE_MAX_SIDE") or 2048)
+RECEIPT_IMAGE_SHORT_SIDE = int(os.getenv("RECEIPT_IMAGE_SHORT_SIDE") or 768)
+RECEIPT_IMAGE_GRAYSCALE  = os.getenv("RECEIPT_IMAGE_GRAYSCALE", "True").strip().lower() == "true"
+RECEIPT_IMAGE_QUALITY    = int(os.getenv("RECEIPT_IMAGE_QUALITY") or 80)
+
+# Avatars: uploads are cropped square and stored only as resized <content hash>_<size> variants
+AVATAR_SIZES   = tuple(sorted(int(n) for n in (os.getenv("AVATAR_SIZES") or "64,128,256").split(",")))
+AVATAR_FORMAT  = "jpeg" if (os.getenv("AVATAR_FORMAT") or "webp").strip().lower() in ("jpg", "jpeg") else "webp"
+AVATAR_QUALITY = int(os.getenv("AVATAR_QUALITY") or 82)
+
+# Static assets: url_for('static', ...) appends ?v=<content hash>, and URLs carrying the current
+# hash are served as immutable for STATIC_MAX_AGE. `flask compress-static` writes .gz/.br copies.
+STATIC_MAX_AGE = int(os.getenv("STATIC_MAX_AGE") or 365 * 24 * 3600)
+
+# Notification badge count cache. Invalidated locally on every change; the TTL bounds how
+# stale another worker's copy can get.
+NOTIF_COUNT_TTL = int(os.getenv("NOTIF_COUNT_TTL") or 60)
+
+# /notifications/stream (SSE). Each open tab holds a connection, so run gunicorn with
+# threaded or gevent workers (e.g. --worker-class gthread --threads 50).
+NOTIF_STREAM_HEARTBEAT = int(os.getenv("NOTIF_STREAM_HEARTBEAT") or 25)
+NOTIF_STREAM_MAX_AGE   = int(os.getenv("NOTIF_STREAM_MAX_AGE") or 300)   # browser reconnects on its own
+NOTIF_PAGE_SIZE        = int(os.getenv("NOTIF_PAGE_SIZE") or 20)
+
+# /calculate batch mode: bills accepted per request
+SPLIT_BATCH_MAX          = int(os.getenv("SPLIT_BATCH_MAX") or 50)
+SPLIT_PREVIEW_CACHE_SIZE = int(os.getenv("SPLIT_PREVIEW_CACHE_SIZE") or 1024)   # memoized /calculate previews
+
+# Transaction history pages ("load more" fetches the next page by id cursor)
+TXN_PAGE_SIZE      = int(os.getenv("TXN_PAGE_SIZE") or 25)
+TXN_HOME_PAGE_SIZE = int(os.getenv("TXN_HOME_PAGE_SIZE") or 10)
+
+# User search: matches pulled from the search index per query, then ranked in Python
+USER_SEARCH_CANDIDATES = int(os.getenv("USER_SEARCH_CANDIDATES") or 200)
+
+# Autocomplete prefix index, kept in memory per worker
+USER_INDEX_REFRESH    = int(os.getenv("USER_INDEX_REFRESH") or 30)         # seconds before checking for new signups
+USER_INDEX_REBUILD    = int(os.getenv("USER_INDEX_REBUILD") or 3600)       # full reload (picks up other workers' renames)
+USER_INDEX_OVERLAP    = int(os.getenv("USER_INDEX_OVERLAP") or 200)        # ids below the last top-up re-read each time
+FRIEND_IDS_TTL        = int(os.getenv("FRIEND_IDS_TTL") or 60)             # cached friend ids for "friends first"
+FRIEND_IDS_CACHE_SIZE = int(os.getenv("FRIEND_IDS_CACHE_SIZE") or 4096)    # users whose friend ids are kept
+
+# "People you may know" on the friends page
+FRIEND_SUGGESTIONS_SHOWN = int(os.getenv("FRIEND_SUGGESTIONS_SHOWN") or 6)
+
 # Init APIs
-client = OpenAI(api_key=OPENAI_API_KEY)
+client = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
 stripe.api_key = STRIPE_SECRET_KEY
 
 # Init Flask
@@ -52,6 +128,109 @@ db.init_app(app)
 migrate = Migrate(app, db)  
 
 
+# ---------- Static assets ----------
+# No build step: the manifest is filled lazily, one content hash per file, and recomputed when
+# a file's mtime or size changes, so a deploy (or an edit in dev) gets new URLs by itself.
+_static_manifest: dict[str, tuple[int, int, str]] = {}
+
+# precompressed copies are only worth it for text; images are already compressed
+_STATIC_COMPRESSIBLE = {".js", ".css", ".svg", ".json", ".html", ".txt", ".map"}
+_STATIC_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def _static_fingerprint(filename: str) -> str | None:
+    path = safe_join(app.static_folder, filename)
+    try:
+        st = os.stat(path)
+    except (TypeError, OSError):
+        return None
+    cached = _static_manifest.get(filename)
+    if cached and cached[:2] == (st.st_mtime_ns, st.st_size):
+        return cached[2]
+    with open(path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:12]
+    _static_manifest[filename] = (st.st_mtime_ns, st.st_size, digest)
+    return digest
+
+
+@app.url_defaults
+def _fingerprint_static_urls(endpoint, values):
+    if endpoint == "static" and "v" not in values:
+        digest = _static_fingerprint(values.get("filename", ""))
+        if digest:
+            values["v"] = digest
+
+
+def _static_variant(filename: str) -> tuple[str, str] | None:
+    """(stored name, encoding) of a fresh .br/.gz copy the client accepts, if there is one."""
+    if os.path.splitext(filename)[1].lower() not in _STATIC_COMPRESSIBLE:
+        return None
+    original = safe_join(app.static_folder, filename)
+    for encoding, suffix in _STATIC_ENCODINGS:
+        if request.accept_encodings[encoding] <= 0:
+            continue
+        try:
+            if os.stat(original + suffix).st_mtime_ns >= os.stat(original).st_mtime_ns:
+                return filename + suffix, encoding
+        except (TypeError, OSError):
+            continue
+    return None
+
+
+def _static(filename):
+    """Replaces Flask's static view: immutable caching for fingerprinted URLs, precompressed copies."""
+    immutable = request.args.get("v") is not None and request.args["v"] == _static_fingerprint(filename)
+    variant = _static_variant(filename)
+    max_age = STATIC_MAX_AGE if immutable else None
+
+    if variant:
+        mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        response = send_from_directory(app.static_folder, variant[0], mimetype=mimetype, max_age=max_age)
+        response.headers["Content-Encoding"] = variant[1]
+    else:
+        response = send_from_directory(app.static_folder, filename, max_age=max_age)
+
+    if os.path.splitext(filename)[1].lower() in _STATIC_COMPRESSIBLE:
+        response.vary.add("Accept-Encoding")
+    if immutable:
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+    return response
+
+
+app.view_functions["static"] = _static
+
+
+@app.cli.command("compress-static")
+def compress_static():
+    """Write .gz (and .br, if the brotli package is installed) next to each text asset in static/."""
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+        print("brotli isn't installed; writing .gz only")
+
+    written = 0
+    for root, _, files in os.walk(app.static_folder):
+        for name in files:
+            if os.path.splitext(name)[1].lower() not in _STATIC_COMPRESSIBLE:
+                continue
+            path = os.path.join(root, name)
+            with open(path, "rb") as f:
+                data = f.read()
+            variants = {".gz": gzip.compress(data, compresslevel=9, mtime=0)}
+            if brotli:
+                variants[".br"] = brotli.compress(data, quality=11)
+            for suffix, blob in variants.items():
+                if len(blob) >= len(data):
+                    continue
+                with open(path + suffix, "wb") as f:
+                    f.write(blob)
+                written += 1
+                print(f"{os.path.relpath(path + suffix, app.static_folder)}: {len(data)} -> {len(blob)} bytes")
+    print(f"{written} precompressed files written")
+
+
 
 # Allowed file extensions
 ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "gif"}
@@ -206,26 +385,40 @@ def home():
         return render_template("landing.html")
 
     user = User.query.get(session["user_id"])
-    transactions = (
-        Transaction.query
-        .filter_by(payer=user.full_name)   # these are “payments to you” in your current logic
-        .order_by(Transaction.id.desc())
-        .all()
-    )
+    # these are “payments to you” in your current logic
+    transactions, next_cursor = _transaction_page(user.id, limit=TXN_HOME_PAGE_SIZE)
 
-    total_paid_to_you = sum(t.amount or 0 for t in transactions)
+    totals = db.session.get(UserTotals, user.id)
+    total_paid_to_you = totals.paid_to_you if totals else 0
 
     return render_template(
         "index.html",
         user_email=user.email,
         user_full_name=user.full_name,
-        friends=user.friends.all(),
-        user_groups=[(gm.group, len(gm.group.members)) for gm in user.group_links],
+        friends=_friends_of(user.id),
+        user_groups=_groups_with_member_counts(user.id),
         transactions=transactions,
+        next_cursor=next_cursor,
         total_paid_to_you=round(total_paid_to_you, 2),
+        receipt_streaming=RECEIPT_STREAM_UPLOADS,
     )
 
 
+def _groups_with_member_counts(user_id: int) -> list:
+    """The user's groups as (Group, member count) rows, in one query however many groups there are."""
+    member_count = (
+        select(func.count(GroupMember.id))
+        .where(GroupMember.group_id == Group.id)
+        .correlate(Group)
+        .scalar_subquery()
+    )
+    return db.session.execute(
+        select(Group, member_count)
+        .where(Group.id.in_(select(GroupMember.group_id).where(GroupMember.user_id == user_id)))
+        .order_by(Group.id)
+    ).all()
+
+
 @app.route("/pricing")
 def pricing():
     return render_template("pricing.html")
@@ -262,6 +455,7 @@ def signup():
         )
         db.session.add(new_user)
         db.session.commit()
+        user_index_changed(new_user)
 
         return redirect(url_for("login"))
 
@@ -305,14 +499,103 @@ def transactions_page():
         return redirect(url_for("login"))
 
     user = User.query.get(session["user_id"])
-    txns = (
-        Transaction.query
-        .filter_by(payer=user.full_name)
-        .order_by(Transaction.id.desc())
-        .limit(50)
-        .all()
+    txns, next_cursor = _transaction_page(user.id)
+    return render_template("transactions.html", user=user, transactions=txns, next_cursor=next_cursor)
+
+
+def _transaction_page(user_id: int, before: int | None = None,
+                      limit: int = TXN_PAGE_SIZE) -> tuple[list[Transaction], int | None]:
+    """
+    One page of a user's transactions, newest first, read off the (payer_id, id DESC) index.
+    `before` is the id cursor from the previous page. Returns (transactions, next_cursor).
+    """
+    query = Transaction.query.filter(Transaction.payer_id == user_id)
+    if before is not None:
+        query = query.filter(Transaction.id < before)
+    rows = query.order_by(Transaction.id.desc()).limit(limit + 1).all()
+
+    next_cursor = rows[limit - 1].id if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def _bump_user_totals(user_id: int | None, amount, count: int = 1) -> None:
+    """
+    Adds `amount` / `count` to the user's running totals inside the caller's transaction,
+    so the aggregate commits (or rolls back) together with the Transaction row.
+    Pass negative values when deleting.
+    """
+    if not user_id:
+        return
+    amount = float(amount or 0)
+
+    bump = (
+        update(UserTotals)
+        .where(UserTotals.user_id == user_id)
+        .values(paid_to_you=UserTotals.paid_to_you + amount,
+                transaction_count=UserTotals.transaction_count + count)
+    )
+    if db.session.execute(bump).rowcount:
+        return
+
+    # first transaction for this user; if another request creates the row first, bump theirs
+    try:
+        with db.session.begin_nested():
+            db.session.add(UserTotals(user_id=user_id, paid_to_you=amount, transaction_count=count))
+    except IntegrityError:
+        db.session.execute(bump)
+
+
+@app.cli.command("reconcile-totals")
+def reconcile_totals():
+    """Rebuild user_totals from the transaction table."""
+    rebuilt = (
+        select(
+            Transaction.payer_id,
+            func.coalesce(func.sum(Transaction.amount), 0),
+            func.count(Transaction.id),
+        )
+        .where(Transaction.payer_id.isnot(None))
+        .group_by(Transaction.payer_id)
+    )
+    before = {t.user_id: (round(t.paid_to_you, 2), t.transaction_count) for t in UserTotals.query.all()}
+    after = {uid: (round(float(total), 2), n) for uid, total, n in db.session.execute(rebuilt).all()}
+
+    db.session.execute(delete(UserTotals))
+    if after:
+        db.session.execute(insert(UserTotals), [
+            {"user_id": uid, "paid_to_you": total, "transaction_count": n} for uid, (total, n) in after.items()
+        ])
+    db.session.commit()
+
+    drifted = sum(1 for uid in before.keys() | after.keys() if before.get(uid) != after.get(uid))
+    print(f"user_totals rebuilt for {len(after)} users ({drifted} had drifted)")
+
+
+# row markup variant -> page size
+_TXN_ROW_VIEWS = {"home": TXN_HOME_PAGE_SIZE, "profile": TXN_PAGE_SIZE, "list": TXN_PAGE_SIZE}
+
+
+@app.route("/transactions/rows")
+def transaction_rows():
+    """
+    Next page of history rows as an HTML fragment for the "load more" button.
+    ?view= picks the markup (home | profile | list); the cursor for the page after
+    this one comes back in the X-Next-Cursor header (absent on the last page).
+    """
+    if "user_id" not in session:
+        return ("", 401)
+
+    view = request.args.get("view", "list")
+    if view not in _TXN_ROW_VIEWS:
+        abort(400)
+
+    txns, next_cursor = _transaction_page(
+        session["user_id"], request.args.get("before", type=int), _TXN_ROW_VIEWS[view]
     )
-    return render_template("transactions.html", user=user, transactions=txns)
+    res = app.make_response(render_template("_transaction_rows.html", transactions=txns, view=view))
+    if next_cursor is not None:
+        res.headers["X-Next-Cursor"] = str(next_cursor)
+    return res
 
 
 @csrf.exempt
@@ -328,20 +611,26 @@ def transaction_detail(txn_id):
 
     txn = Transaction.query.get_or_404(txn_id)
     me = User.query.get(session["user_id"])
-    if txn.payer != me.full_name:
+    if txn.payer_id != me.id:
         abort(403)
 
-    # Parse itemized lines from txn.description
-    items = []
-    for line in (txn.description or "").splitlines():
-        m = re.match(r"^(.*?)\s+\(\$(\d+(?:\.\d{2})?)\)\s+split between:\s*(.*)$", line)
-        if m:
-            name, price, owners = (
-                m.group(1).strip(),
-                float(m.group(2)),
-                [o.strip() for o in m.group(3).split(",") if o.strip()],
-            )
-            items.append({"name": name, "price": price, "owners": owners})
+    # items + owners in one joined query, in receipt order
+    rows = (
+        db.session.query(TransactionItem.id, TransactionItem.name, TransactionItem.price,
+                         TransactionItemOwner.owner, TransactionItemOwner.amount)
+        .outerjoin(TransactionItemOwner, TransactionItemOwner.item_id == TransactionItem.id)
+        .filter(TransactionItem.transaction_id == txn.id)
+        .order_by(TransactionItem.position, TransactionItemOwner.position)
+        .all()
+    )
+    items, by_id = [], {}
+    for item_id, name, price, owner, amount in rows:
+        if item_id not in by_id:
+            by_id[item_id] = {"name": name, "price": price, "owners": [], "shares": []}
+            items.append(by_id[item_id])
+        if owner is not None:
+            by_id[item_id]["owners"].append(owner)
+            by_id[item_id]["shares"].append({"owner": owner, "amount": amount})
 
     return render_template("transactions.html", txn=txn, items=items)
 
@@ -355,10 +644,13 @@ def delete_transaction(txn_id):
     txn = Transaction.query.get_or_404(txn_id)
     me = User.query.get(session["user_id"])
 
-    if txn.payer != me.full_name:
+    if txn.payer_id != me.id:
         abort(403)
 
+    if txn.group_id is not None:
+        _reverse_group_ledger(txn.id)
     db.session.delete(txn)
+    _bump_user_totals(txn.payer_id, -(txn.amount or 0), -1)
     db.session.commit()
 
     if request.headers.get("X-Requested-With") == "fetch":
@@ -368,6 +660,417 @@ def delete_transaction(txn_id):
 
 
 
+# ---------- User search ----------
+# Indexed by migration 1b7d4e9a2c60: an FTS5 trigram table on SQLite, pg_trgm GIN indexes on
+# Postgres. Exact and prefix matches go through the lower() indexes from c4f1a7e3d920 instead.
+# Queries shorter than a trigram only match prefixes (of the name, username or a later word);
+# short prefixes are common enough that the word-start scan reaches its LIMIT quickly.
+_user_search_backend_name: str | None = None
+
+
+def _user_search_backend() -> str:
+    """'fts5', 'trgm' or 'like' (no index, e.g. a database that hasn't been migrated yet)."""
+    global _user_search_backend_name
+    if _user_search_backend_name is None:
+        dialect = db.engine.dialect.name
+        backend = "like"
+        try:
+            if dialect == "sqlite":
+                found = db.session.execute(text(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_search'"
+                )).first()
+                backend = "fts5" if found else "like"
+            elif dialect == "postgresql":
+                found = db.session.execute(text(
+                    "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"
+                )).first()
+                backend = "trgm" if found else "like"
+        except Exception as e:
+            print("user search backend check failed:", repr(e))
+        if backend == "like":
+            print(f"user search: no search index on {dialect}, falling back to ILIKE scans")
+        _user_search_backend_name = backend
+    return _user_search_backend_name
+
+
+def _search_rank(user: User, q: str) -> tuple:
+    """Exact name/username, then prefix, then start of a later word, then anywhere."""
+    name = (user.full_name or "").lower()
+    username = (user.username or "").lower()
+    if q in (name, username):
+        tier = 0
+    elif name.startswith(q) or username.startswith(q):
+        tier = 1
+    elif any(word.startswith(q) for word in name.split()):
+        tier = 2
+    else:
+        tier = 3
+    return tier, name, username
+
+
+def _name_key(column):
+    """lower(column) as ix_user_*_lower indexes it."""
+    key = func.lower(column)
+    return key.collate("C") if db.engine.dialect.name == "postgresql" else key
+
+
+def _folded(q: str):
+    """q lowercased by the database, so it folds exactly like the lower(column) it's compared to
+    (SQLite's lower() only folds ASCII; Python's str.lower() would fold "É" where SQLite doesn't)."""
+    return func.lower(literal(q, String))
+
+
+def _starts_with(key, q: str):
+    """key starts with lower(q), as the index range lower(q) <= key < lower(q) || U+10FFFF."""
+    return and_(key >= _folded(q), key < _folded(q) + "\U0010ffff")
+
+
+def _fts_users(q: str, exclude_id: int | None, limit: int, where: str = "", **params) -> list[User]:
+    """Users whose name or username contains q per the FTS5 table, optionally filtered further."""
+    # a quoted FTS5 string is matched as a substring by the trigram tokenizer
+    stmt = select(User).from_statement(text(f"""
+        SELECT "user".* FROM user_search
+        JOIN "user" ON "user".id = user_search.rowid
+        WHERE user_search MATCH :phrase AND "user".id IS NOT :exclude_id {where}
+        LIMIT :limit
+    """))
+    return db.session.scalars(stmt, {
+        "phrase": '"' + q.replace('"', '""') + '"',
+        "exclude_id": exclude_id,
+        "limit": limit,
+        **params,
+    }).all()
+
+
+def _search_users(q: str, limit: int, exclude_id: int | None = None, substrings: bool = True) -> list[User]:
+    """
+    Users whose full name or username contains q (case-insensitive), best matches first.
+    With substrings=False only the prefix tiers run: username, full name or a later word of
+    it starts with q, the same matches UserPrefixIndex.search() gives the autocomplete.
+    Each _search_rank tier is its own LIMITed, indexed query, and a tier only runs if the
+    ones before it came up short, so an exact or prefix hit can never lose its place to
+    a substring match. Only the substring tier is a sample: up to USER_SEARCH_CANDIDATES
+    rows with no ORDER BY (sorting every "ann" match in SQL is what blows the latency
+    budget), ranked here.
+    """
+    # q is only lowercased in SQL (see _folded); q_lower is for ranking here
+    q = " ".join(q.split())
+    if not q:
+        return []
+    q_lower = q.lower()
+
+    backend = _user_search_backend()
+    found: dict[int, User] = {}
+
+    def take(users):
+        for user in sorted(users, key=lambda u: _search_rank(u, q_lower)):
+            if len(found) < limit and user.id not in found:
+                found[user.id] = user
+
+    def users_where(*conds, order_by=None, cap=limit):
+        query = User.query.filter(*conds)
+        if exclude_id is not None:
+            query = query.filter(User.id != exclude_id)
+        if order_by is not None:
+            query = query.order_by(order_by)
+        return query.limit(cap).all()
+
+    name_key, username_key = _name_key(User.full_name), _name_key(User.username)
+
+    # exact, then prefix: ranges on the lower() indexes, read in key order
+    take(users_where(or_(name_key == _folded(q), username_key == _folded(q))))
+    if len(found) < limit:
+        take(users_where(_starts_with(name_key, q), order_by=name_key)
+             + users_where(_starts_with(username_key, q), order_by=username_key))
+
+    # start of a later word of the full name
+    if len(found) < limit:
+        if backend == "fts5" and len(q) >= 3:
+            pattern = "% " + q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            take(_fts_users(q, exclude_id, limit + len(found),
+                            where="AND \"user\".full_name LIKE :pattern ESCAPE '\\'", pattern=pattern))
+        else:
+            # pg_trgm's GIN indexes serve this ILIKE (and the one below) directly
+            take(users_where(User.full_name.icontains(" " + q, autoescape=True), cap=limit + len(found)))
+
+    # anywhere; queries shorter than a trigram can't use either index, so they stop at prefixes
+    if substrings and len(found) < limit and len(q) >= 3:
+        if backend == "fts5":
+            take(_fts_users(q, exclude_id, USER_SEARCH_CANDIDATES))
+        else:
+            take(users_where(or_(User.full_name.icontains(q, autoescape=True),
+                                 User.username.icontains(q, autoescape=True)),
+                             cap=USER_SEARCH_CANDIDATES))
+
+    return list(found.values())
+
+
+# ---------- Friendships ----------
+# friendships holds each pair once as (lower id, higher id): membership is one PK probe,
+# and a user's friends are one range scan on the PK plus one on ix_friendships_friend_id.
+def _friend_pair(a: int, b: int) -> dict:
+    return {"user_id": min(a, b), "friend_id": max(a, b)}
+
+
+def _friend_ids_select(user_id: int):
+    return union_all(
+        select(friendships.c.friend_id.label("id")).where(friendships.c.user_id == user_id),
+        select(friendships.c.user_id.label("id")).where(friendships.c.friend_id == user_id),
+    )
+
+
+def _friends_of(user_id: int) -> list[User]:
+    return (
+        User.query
+        .filter(User.id.in_(_friend_ids_select(user_id)))
+        .order_by(User.full_name.asc(), User.id.asc())
+        .all()
+    )
+
+
+def _are_friends(a: int, b: int) -> bool:
+    pair = _friend_pair(a, b)
+    return db.session.scalar(select(exists().where(
+        friendships.c.user_id == pair["user_id"],
+        friendships.c.friend_id == pair["friend_id"],
+    )))
+
+
+def _add_friendship(a: int, b: int) -> bool:
+    """Adds the pair inside the caller's transaction; False if they were already friends."""
+    if a == b or _are_friends(a, b):
+        return False
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(friendships).values(**_friend_pair(a, b)))
+    except IntegrityError:
+        return False
+    return True
+
+
+# ---------- Friend suggestions ----------
+# friend_suggestion is precomputed so the friends page never walks the graph: rebuilt in one
+# INSERT ... SELECT by `flask rebuild-suggestions`, bumped as friendships / group memberships
+# are added and as members leave groups. Unfriending isn't possible in the app; other removals
+# (manual SQL, deleted users or groups) are only picked up by the rebuild.
+_SUGGEST_MUTUAL_WEIGHT = 2   # a mutual friend counts as much as two shared groups
+
+_REBUILD_SUGGESTIONS_SQL = text("""
+    WITH edges (a, b) AS (
+        SELECT user_id, friend_id FROM friendships
+        UNION ALL
+        SELECT friend_id, user_id FROM friendships
+    ),
+    raw (user_id, candidate_id, mutual_friends, shared_groups) AS (
+        SELECT e1.a, e2.b, COUNT(*), 0
+        FROM edges e1 JOIN edges e2 ON e2.a = e1.b
+        WHERE e2.b <> e1.a
+        GROUP BY e1.a, e2.b
+        UNION ALL
+        SELECT m1.user_id, m2.user_id, 0, COUNT(DISTINCT m1.group_id)
+        FROM group_member m1 JOIN group_member m2 ON m2.group_id = m1.group_id
+        WHERE m2.user_id <> m1.user_id
+        GROUP BY m1.user_id, m2.user_id
+    )
+    INSERT INTO friend_suggestion (user_id, candidate_id, mutual_friends, shared_groups, score)
+    SELECT r.user_id, r.candidate_id, SUM(r.mutual_friends), SUM(r.shared_groups),
+           :mutual_weight * SUM(r.mutual_friends) + SUM(r.shared_groups)
+    FROM raw r
+    WHERE NOT EXISTS (
+        SELECT 1 FROM friendships f
+        WHERE f.user_id = CASE WHEN r.user_id < r.candidate_id THEN r.user_id ELSE r.candidate_id END
+          AND f.friend_id = CASE WHEN r.user_id < r.candidate_id THEN r.candidate_id ELSE r.user_id END
+    )
+    GROUP BY r.user_id, r.candidate_id
+""")
+
+
+@app.cli.command("rebuild-suggestions")
+def rebuild_suggestions():
+    """Recompute friend_suggestion from friendships and group_member."""
+    db.session.execute(delete(FriendSuggestion))
+    db.session.execute(_REBUILD_SUGGESTIONS_SQL, {"mutual_weight": _SUGGEST_MUTUAL_WEIGHT})
+    db.session.commit()
+    print(f"friend_suggestion rebuilt: {db.session.scalar(select(func.count()).select_from(FriendSuggestion))} rows")
+
+
+def _bump_suggestions(pairs, mutual: int = 0, groups: int = 0) -> None:
+    """
+    Adds to the (user_id, candidate_id) suggestion rows, both directions as given, inside the
+    caller's transaction. Creates missing rows when adding (a decrement only touches existing
+    ones); one executemany UPDATE for the rest.
+    """
+    pairs = set(pairs)
+    if not pairs:
+        return
+
+    existing = {tuple(row) for row in db.session.execute(
+        select(FriendSuggestion.user_id, FriendSuggestion.candidate_id)
+        .where(tuple_(FriendSuggestion.user_id, FriendSuggestion.candidate_id).in_(pairs))
+    )}
+    for uid, cid in (pairs - existing if mutual >= 0 and groups >= 0 else ()):
+        # a concurrent request may create it first; then it's bumped below like the others
+        try:
+            with db.session.begin_nested():
+                db.session.add(FriendSuggestion(user_id=uid, candidate_id=cid,
+                                                mutual_friends=0, shared_groups=0, score=0))
+        except IntegrityError:
+            pass
+
+    table = FriendSuggestion.__table__
+    db.session.execute(
+        update(table)
+        .where(table.c.user_id == bindparam("s_user"), table.c.candidate_id == bindparam("s_candidate"))
+        .values(mutual_friends=table.c.mutual_friends + mutual,
+                shared_groups=table.c.shared_groups + groups,
+                score=table.c.score + _SUGGEST_MUTUAL_WEIGHT * mutual + groups),
+        [{"s_user": uid, "s_candidate": cid} for uid, cid in pairs],
+    )
+
+
+def _suggestions_on_friendship(a: int, b: int) -> None:
+    """Call right after _add_friendship(a, b) succeeds, in the same transaction."""
+    db.session.execute(delete(FriendSuggestion).where(or_(
+        and_(FriendSuggestion.user_id == a, FriendSuggestion.candidate_id == b),
+        and_(FriendSuggestion.user_id == b, FriendSuggestion.candidate_id == a),
+    )))
+
+    # b now has a as a mutual friend with each of a's other friends, and the other way round
+    friends_a = set(db.session.scalars(_friend_ids_select(a))) - {b}
+    friends_b = set(db.session.scalars(_friend_ids_select(b))) - {a}
+    pairs = [(b, f) for f in friends_a - friends_b] + [(a, f) for f in friends_b - friends_a]
+    _bump_suggestions(pairs + [(f, u) for u, f in pairs], mutual=1)
+
+
+def _suggestions_on_group_join(user_id: int, group_id: int) -> None:
+    """Call after adding user_id to the group, in the same transaction."""
+    others = set(db.session.scalars(
+        select(GroupMember.user_id).where(GroupMember.group_id == group_id, GroupMember.user_id != user_id)
+    ))
+    others -= set(db.session.scalars(_friend_ids_select(user_id)))
+    _bump_suggestions([(user_id, m) for m in others] + [(m, user_id) for m in others], groups=1)
+
+
+def _suggestions_on_group_leave(user_id: int, group_id: int) -> None:
+    """Call after removing user_id from the group, in the same transaction."""
+    others = set(db.session.scalars(
+        select(GroupMember.user_id).where(GroupMember.group_id == group_id, GroupMember.user_id != user_id)
+    ))
+    others -= set(db.session.scalars(_friend_ids_select(user_id)))
+    pairs = [(user_id, m) for m in others] + [(m, user_id) for m in others]
+    _bump_suggestions(pairs, groups=-1)
+
+    # nothing left in common: no longer a suggestion
+    if pairs:
+        db.session.execute(delete(FriendSuggestion).where(
+            tuple_(FriendSuggestion.user_id, FriendSuggestion.candidate_id).in_(pairs),
+            FriendSuggestion.mutual_friends <= 0,
+            FriendSuggestion.shared_groups <= 0,
+        ))
+
+
+def _suggestions_for(user_id: int, limit: int) -> list:
+    """Top suggestions as (User, mutual_friends, shared_groups), skipping pending requests."""
+    pending = select(FriendRequest.id).where(
+        FriendRequest.status == 'pending',
+        or_(and_(FriendRequest.from_user_id == user_id, FriendRequest.to_user_id == User.id),
+            and_(FriendRequest.from_user_id == User.id, FriendRequest.to_user_id == user_id)),
+    )
+    return db.session.execute(
+        select(User, FriendSuggestion.mutual_friends, FriendSuggestion.shared_groups)
+        .join(FriendSuggestion, FriendSuggestion.candidate_id == User.id)
+        .where(FriendSuggestion.user_id == user_id, ~pending.exists())
+        .order_by(FriendSuggestion.score.desc(), FriendSuggestion.candidate_id)
+        .limit(limit)
+    ).all()
+
+
+# ---------- Autocomplete prefix index ----------
+# /api/users/search runs on every keystroke, so each worker answers it from a UserPrefixIndex
+# instead of the database. New signups from this worker go in straight away
+# (user_index_changed); every USER_INDEX_REFRESH seconds a background top-up reads users past
+# the highest id it has read from the DB (signups on other workers), and every
+# USER_INDEX_REBUILD seconds it reloads everything. While the index is cold or overdue a
+# top-up, searches use the DB.
+#
+# The top-up watermark only moves on DB reads, never on local upserts, so another worker's
+# signup with a lower id than ours isn't skipped. Each top-up also re-reads the last
+# USER_INDEX_OVERLAP ids, for ids that commit out of order (Postgres sequences).
+_user_index = UserPrefixIndex()
+_user_index_state = {"refreshed_at": 0.0, "built_at": 0.0, "running": False, "db_max_id": 0}
+_user_index_lock = threading.Lock()
+
+_friend_ids_cache: OrderedDict[int, tuple[float, frozenset]] = OrderedDict()
+_friend_ids_lock = threading.Lock()
+
+
+def _user_index_rows(*criteria):
+    return db.session.execute(
+        select(User.id, User.full_name, User.username, User.profile_pic).where(*criteria)
+    ).all()
+
+
+def _refresh_user_index() -> None:
+    try:
+        with app.app_context():
+            now = time.time()
+            if not _user_index.built or now - _user_index_state["built_at"] > USER_INDEX_REBUILD:
+                rows = _user_index_rows()
+                _user_index.load(rows)
+                _user_index_state["built_at"] = now
+            else:
+                rows = _user_index_rows(User.id > _user_index_state["db_max_id"] - USER_INDEX_OVERLAP)
+                _user_index.upsert(rows)
+            _user_index_state["db_max_id"] = max((row[0] for row in rows), default=_user_index_state["db_max_id"])
+            _user_index_state["refreshed_at"] = now
+    except Exception as e:
+        print("user index refresh failed:", repr(e))
+    finally:
+        with _user_index_lock:
+            _user_index_state["running"] = False
+
+
+def _user_index_ready() -> bool:
+    """True if the index is fresh enough to answer from; otherwise starts a refresh."""
+    if _user_index.built and time.time() - _user_index_state["refreshed_at"] < USER_INDEX_REFRESH:
+        return True
+    with _user_index_lock:
+        if not _user_index_state["running"]:
+            _user_index_state["running"] = True
+            threading.Thread(target=_refresh_user_index, daemon=True).start()
+    return False
+
+
+def user_index_changed(*users: User) -> None:
+    """Call after committing a signup or a name/username change."""
+    _user_index.upsert((u.id, u.full_name, u.username, u.profile_pic) for u in users)
+
+
+def _friend_ids(user_id: int) -> frozenset:
+    now = time.monotonic()
+    with _friend_ids_lock:
+        hit = _friend_ids_cache.get(user_id)
+        if hit and hit[0] > now:
+            _friend_ids_cache.move_to_end(user_id)
+            return hit[1]
+
+    ids = frozenset(db.session.scalars(_friend_ids_select(user_id)))
+    if FRIEND_IDS_CACHE_SIZE > 0:
+        with _friend_ids_lock:
+            _friend_ids_cache[user_id] = (now + FRIEND_IDS_TTL, ids)
+            _friend_ids_cache.move_to_end(user_id)
+            while len(_friend_ids_cache) > FRIEND_IDS_CACHE_SIZE:
+                _friend_ids_cache.popitem(last=False)
+    return ids
+
+
+def friends_changed(*user_ids) -> None:
+    """Call after committing a new friendship; drops the cached friend ids."""
+    with _friend_ids_lock:
+        for uid in user_ids:
+            _friend_ids_cache.pop(uid, None)
+
+
 @csrf.exempt
 @app.route('/friends', methods=['GET', 'POST'])
 def friends():
@@ -382,19 +1085,11 @@ def friends():
     search_results = []   # <-- multiple results now
 
     if request.method == 'POST':
-        # 1) Search by *full name* (partial, case-insensitive)
+        # 1) Search by name or username (partial, case-insensitive)
         q = (request.form.get('search_name') or "").strip()
         if q:
-            # Find up to 10 people whose full_name contains the query
-            matches = (
-                User.query
-                .filter(User.full_name.ilike(f"%{q}%"))
-                .order_by(User.full_name.asc())
-                .limit(10)
-                .all()
-            )
-            # Hide yourself; we’ll still show existing friends (so the UI can say “Already friends” if you want)
-            search_results = [u for u in matches if u.id != me.id]
+            # Up to 10 people, minus yourself; we’ll still show existing friends (so the UI can say “Already friends” if you want)
+            search_results = _search_users(q, 10, exclude_id=me.id)
 
         # 2) Send request by hidden id (from the “Send Request” button next to a result)
         to_id = request.form.get('send_request_to_id')
@@ -408,7 +1103,7 @@ def friends():
                 msg = "User not found."
             elif to_user.id == me.id:
                 msg = "You can’t send a friend request to yourself."
-            elif to_user in me.friends:
+            elif _are_friends(me.id, to_user.id):
                 msg = "You’re already friends."
             else:
                 # Block duplicates in either direction
@@ -425,7 +1120,14 @@ def friends():
                     try:
                         fr = FriendRequest(from_user_id=me.id, to_user_id=to_user.id, status='pending')
                         db.session.add(fr)
+                        db.session.flush()
+                        _notify([{
+                            "user_id": to_user.id, "kind": "friend_request", "ref_id": fr.id,
+                            "actor_id": me.id, "message": "sent you a friend request",
+                            "created_at": fr.created_at,
+                        }])
                         db.session.commit()
+                        notifications_changed(to_user.id)
                         msg = "Friend request sent!"
                     except Exception as e:
                         db.session.rollback()
@@ -447,7 +1149,8 @@ def friends():
     return render_template(
         "friends.html",
         user=me,
-        friends=me.friends.all(),
+        friends=_friends_of(me.id),
+        suggestions=_suggestions_for(me.id, FRIEND_SUGGESTIONS_SHOWN),
         search_results=search_results,   # <-- pass list
         pending_requests=pending_requests,
         message=msg,
@@ -465,28 +1168,25 @@ def user_search():
     if not q:
         return jsonify([])
 
-    # case-insensitive partial match on full name (and also username as fallback)
-    ilike = f"%{q}%"
-    users = (
-        User.query
-            .filter(or_(User.full_name.ilike(ilike),
-                        User.username.ilike(ilike)))
-            .order_by(User.full_name.asc(), User.username.asc())
-            .limit(12)
-            .all()
-    )
-
+    # prefix match on username / full name words from this worker's index, friends first;
+    # the same prefix match through the DB while the prefix index is cold or stale
     me_id = session["user_id"]
+    friend_ids = _friend_ids(me_id)
+    if _user_index_ready():
+        rows = _user_index.search(q, 12, exclude_id=me_id, first=friend_ids)
+    else:
+        users = _search_users(q, 12, exclude_id=me_id, substrings=False)
+        users.sort(key=lambda u: u.id not in friend_ids)
+        rows = [(u.id, u.full_name, u.username, u.profile_pic) for u in users]
+
     out = []
-    for u in users:
-        if u.id == me_id:
-            continue
+    for uid, full_name, username, profile_pic in rows:
         out.append({
-            "id": u.id,
-            "full_name": u.full_name or "",
-            "username": u.username or "",
-            "avatar": (url_for('static', filename=f'profile_pics/{u.profile_pic}')
-                       if u.profile_pic else url_for('static', filename='profile_pics/default.jpg')),
+            "id": uid,
+            "full_name": full_name or "",
+            "username": username or "",
+            "is_friend": uid in friend_ids,
+            "avatar": _avatar_url(profile_pic, 128),
         })
     return jsonify(out)
 
@@ -500,22 +1200,136 @@ def accept_request(request_id):
     fr = FriendRequest.query.get(request_id)
     if fr and fr.to_user_id == session['user_id']:
         fr.status = 'accepted'
-        user = User.query.get(fr.to_user_id)
-        sender = User.query.get(fr.from_user_id)
-        user.friends.append(sender)
-        sender.friends.append(user)
+        if _add_friendship(fr.to_user_id, fr.from_user_id):
+            _suggestions_on_friendship(fr.to_user_id, fr.from_user_id)
+        _resolve_notifications("friend_request", fr.id)
         db.session.commit()
+        notifications_changed(session['user_id'])
+        friends_changed(fr.to_user_id, fr.from_user_id)
 
     return redirect(url_for('friends'))
 
 
 
+_notif_count_cache: dict[int, tuple[float, int]] = {}
+_notif_count_lock = threading.Lock()
+
+
+class NotificationHub:
+    """
+    Per-user version counters for the notification stream, in this process only. Every user
+    with an open stream gets their own Condition, so a change only wakes that user's
+    connections; the entry goes away when their last stream unsubscribes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions: dict[int, int] = {}
+        self._conditions: dict[int, threading.Condition] = {}
+        self._subscribers: dict[int, int] = {}
+
+    def subscribe(self, user_id: int) -> None:
+        with self._lock:
+            self._subscribers[user_id] = self._subscribers.get(user_id, 0) + 1
+            if user_id not in self._conditions:
+                self._conditions[user_id] = threading.Condition(self._lock)
+                self._versions[user_id] = 0
+
+    def unsubscribe(self, user_id: int) -> None:
+        with self._lock:
+            left = self._subscribers.get(user_id, 0) - 1
+            if left > 0:
+                self._subscribers[user_id] = left
+            else:
+                self._subscribers.pop(user_id, None)
+                self._conditions.pop(user_id, None)
+                self._versions.pop(user_id, None)
+
+    def publish(self, user_id: int) -> None:
+        with self._lock:
+            cond = self._conditions.get(user_id)
+            if cond is not None:     # nobody listening on this worker otherwise
+                self._versions[user_id] += 1
+                cond.notify_all()
+
+    def wait(self, user_id: int, cursor: int, timeout: float) -> int:
+        """
+        Blocks until the user's version moves past `cursor` or `timeout` runs out. Returns the
+        version. Only valid between subscribe() and unsubscribe().
+        """
+        with self._lock:
+            self._conditions[user_id].wait_for(lambda: self._versions[user_id] != cursor, timeout)
+            return self._versions[user_id]
+
+
+notification_hub = NotificationHub()
+
+
+def notifications_changed(*user_ids) -> None:
+    """
+    Call after committing any change to these users' inbox (new, resolved or read rows):
+    drops their cached badge count and wakes their open streams.
+    """
+    with _notif_count_lock:
+        for uid in user_ids:
+            _notif_count_cache.pop(uid, None)
+    for uid in user_ids:
+        notification_hub.publish(uid)
+
+
+def _notify(rows: list[dict]) -> None:
+    """
+    Adds inbox rows to the current transaction as one bulk INSERT. The caller commits
+    together with the request/invite that caused them, then calls notifications_changed().
+    Each row: user_id, kind, ref_id, actor_id, message (+ optional created_at).
+    """
+    if rows:
+        db.session.execute(insert(Notification), rows)
+
+
+def _resolve_notifications(kind: str, *ref_ids: int) -> None:
+    """Drops the inbox rows for requests/invites that were accepted or declined (one DELETE)."""
+    if ref_ids:
+        db.session.execute(
+            delete(Notification).where(Notification.kind == kind, Notification.ref_id.in_(ref_ids))
+        )
+
+
+def _inbox_state(user_id: int) -> tuple[int, int]:
+    """
+    (unread count, newest unread id) straight from the DB, refreshing the cached badge count.
+    Changes made on another worker never reach this process's NotificationHub; this is how
+    an open stream notices them.
+    """
+    count, newest = db.session.execute(
+        select(func.count(), func.max(Notification.id))
+        .where(Notification.user_id == user_id, Notification.is_read.is_(False))
+    ).one()
+    with _notif_count_lock:
+        _notif_count_cache[user_id] = (time.monotonic(), count or 0)
+    return count or 0, newest or 0
+
+
 def notification_count_for(user_id: int) -> int:
     if not user_id:
         return 0
-    fr_count = FriendRequest.query.filter_by(to_user_id=user_id, status='pending').count()
-    gi_count = GroupInvite.query.filter_by(to_user_id=user_id, status='pending').count()
-    return (fr_count or 0) + (gi_count or 0)
+
+    now = time.monotonic()
+    with _notif_count_lock:
+        cached = _notif_count_cache.get(user_id)
+    if cached and now - cached[0] < NOTIF_COUNT_TTL:
+        return cached[1]
+
+    # covered by ix_notification_inbox (user_id, is_read, created_at)
+    count = db.session.execute(
+        select(func.count())
+        .select_from(Notification)
+        .where(Notification.user_id == user_id, Notification.is_read.is_(False))
+    ).scalar() or 0
+
+    with _notif_count_lock:
+        _notif_count_cache[user_id] = (now, count)
+    return count
 
 @app.context_processor
 def inject_notif_count():
@@ -523,66 +1337,167 @@ def inject_notif_count():
     return {'notif_count': notification_count_for(uid)}
 
 
-def _avatar_url(filename: str | None) -> str:
+# ---------- Avatars ----------
+_AVATAR_EXT = {"webp": "webp", "jpeg": "jpg"}
+_AVATAR_NAME = re.compile(r"^([0-9a-f]{16})\.(webp|jpg)$")
+
+
+def _save_avatar(data: bytes) -> str:
+    """
+    Crops an uploaded picture to a centred square and writes one variant per AVATAR_SIZES as
+    profile_pics/<hash>_<size>.<ext>; returns "<hash>.<ext>" for User.profile_pic. Names come
+    from the upload's bytes, so users can't overwrite each other's pictures and re-uploading
+    the same one reuses the files. The original isn't kept. Raises if PIL can't read it.
+    """
+    ext = _AVATAR_EXT[AVATAR_FORMAT]
+    digest = hashlib.sha256(data).hexdigest()[:16]
+    folder = app.config["UPLOAD_FOLDER"]
+    paths = {size: os.path.join(folder, f"{digest}_{size}.{ext}") for size in AVATAR_SIZES}
+    if all(os.path.exists(path) for path in paths.values()):
+        return f"{digest}.{ext}"
+
+    img = Image.open(io.BytesIO(data))
+    largest = AVATAR_SIZES[-1]
+    img.draft("RGB", (largest, largest))   # JPEG only: decode phone photos at a reduced size
+    img = ImageOps.exif_transpose(img).convert("RGB")
+    side = min(img.size)
+
+    options = {"quality": AVATAR_QUALITY}
+    options.update({"method": 6} if AVATAR_FORMAT == "webp" else {"optimize": True, "progressive": True})
+    for size, path in paths.items():
+        variant = ImageOps.fit(img, (min(size, side),) * 2, Image.LANCZOS)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"   # concurrent uploads of the same picture race harmlessly
+        variant.save(tmp, format=AVATAR_FORMAT.upper(), **options)
+        os.replace(tmp, path)
+    return f"{digest}.{ext}"
+
+
+def _avatar_url(filename: str | None, size: int = 128) -> str:
+    """
+    URL of the smallest stored variant at least `size` px wide; pass about twice the CSS size
+    for high-DPI screens. Pictures uploaded before variants existed are served as-is until
+    `flask rebuild-avatars` converts them.
+    """
+    match = _AVATAR_NAME.match(filename or "")
+    if match:
+        variant = next((s for s in AVATAR_SIZES if s >= size), AVATAR_SIZES[-1])
+        return url_for('static', filename=f'profile_pics/{match[1]}_{variant}.{match[2]}')
     if filename:
         return url_for('static', filename=f'profile_pics/{filename}')
-    return url_for('static', filename='profile_pics/default.png')
+    return url_for('static', filename='profile_pics/default.jpg')
 
-def _pending_notifications(user_id: int) -> list[dict]:
-    """Return a list of normalized notification dicts the JS expects."""
-    if not user_id:
-        return []
 
-    items: list[dict] = []
+app.add_template_global(_avatar_url, name="avatar_url")
 
-    # Friend requests -> type: 'friend_request'
-    frs = (
-        db.session.query(FriendRequest, User)
-        .join(User, User.id == FriendRequest.from_user_id)
-        .filter(and_(
-            FriendRequest.to_user_id == user_id,
-            FriendRequest.status == 'pending'
-        ))
-        .order_by(FriendRequest.id.desc())
-        .all()
-    )
-    for fr, sender in frs:
-        created = getattr(fr, "created_at", None)
-        items.append({
-            "id": fr.id,                         # numeric, matches /accept_request/<id>
-            "type": "friend_request",
-            "sender_name": sender.full_name or sender.username,
-            "sender_pic": _avatar_url(sender.profile_pic),
-            "created_at": (created.isoformat() if created else datetime.utcnow().isoformat()),
-            "href": url_for('friends'),
-        })
 
-    gis = (
-        db.session.query(GroupInvite, Group, User)
-        .join(Group, Group.id == GroupInvite.group_id)
-        .join(User, User.id == GroupInvite.from_user_id)
-        .filter(and_(
-            GroupInvite.to_user_id == user_id,
-            GroupInvite.status == 'pending'
-        ))
-        .order_by(GroupInvite.id.desc())
-        .all()
+@app.cli.command("rebuild-avatars")
+@click.option("--delete-originals", is_flag=True, help="Remove converted originals no user references any more.")
+def rebuild_avatars(delete_originals):
+    """Convert avatars uploaded before the thumbnail pipeline into hashed variants."""
+    folder = app.config["UPLOAD_FOLDER"]
+    converted, failed, originals = 0, 0, set()
+    for user in User.query.filter(User.profile_pic.isnot(None), User.profile_pic != "default.jpg"):
+        if _AVATAR_NAME.match(user.profile_pic):
+            continue
+        path = os.path.join(folder, user.profile_pic)
+        try:
+            with open(path, "rb") as f:
+                user.profile_pic = _save_avatar(f.read())
+        except Exception as e:
+            print(f"user {user.id}: can't convert {path}: {e!r}")
+            failed += 1
+            continue
+        originals.add(path)
+        converted += 1
+    db.session.commit()
+
+    freed = 0
+    if delete_originals:
+        still_used = {os.path.join(folder, name) for name in db.session.scalars(select(User.profile_pic).distinct()) if name}
+        for path in originals - still_used:
+            freed += os.path.getsize(path)
+            os.remove(path)
+    print(f"avatars: {converted} converted, {failed} failed, {freed // 1024} KiB of originals removed")
+
+def _encode_notif_cursor(created_at: datetime, row_id: int) -> str:
+    return f"{created_at.isoformat()}~{row_id}"
+
+
+def _decode_notif_cursor(cursor: str) -> tuple[datetime, int]:
+    created_iso, row_id = cursor.split("~")
+    return datetime.fromisoformat(created_iso), int(row_id)
+
+
+def _inbox_page(user_id: int, before: str | None = None,
+                limit: int = NOTIF_PAGE_SIZE) -> tuple[list[dict], str | None]:
+    """
+    One page of the user's inbox, newest first, as the dicts the JS expects.
+    `before` is the cursor returned for the previous page. Returns (items, next_cursor).
+    """
+    if not user_id:
+        return [], None
+
+    query = (
+        select(
+            Notification.id, Notification.kind, Notification.ref_id, Notification.message,
+            Notification.created_at, Notification.is_read,
+            User.full_name, User.username, User.profile_pic,
+            Group.name.label("group_name"),
+        )
+        .outerjoin(User, User.id == Notification.actor_id)
+        .outerjoin(GroupInvite, and_(Notification.kind == 'group_invite', GroupInvite.id == Notification.ref_id))
+        .outerjoin(Group, Group.id == GroupInvite.group_id)
+        .where(Notification.user_id == user_id)
+        .order_by(Notification.created_at.desc(), Notification.id.desc())
+        .limit(limit + 1)
     )
-    for gi, group, inviter in gis:
-        created = getattr(gi, "created_at", None)
-        items.append({
-            "invite_id": gi.id,                  
-            "type": "group_invite",
-            "group_name": group.name,
-            "inviter_name": inviter.full_name or inviter.username,
-            "inviter_pic": _avatar_url(inviter.profile_pic),
-            "created_at": (created.isoformat() if created else datetime.utcnow().isoformat()),
-            "href": url_for('my_invites'),
-        })
+    if before:
+        b_created, b_id = _decode_notif_cursor(before)
+        query = query.where(or_(
+            Notification.created_at < b_created,
+            and_(Notification.created_at == b_created, Notification.id < b_id),
+        ))
 
-    # newest first
-    items.sort(key=lambda x: x["created_at"], reverse=True)
-    return items
+    rows = db.session.execute(query).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = _encode_notif_cursor(last.created_at, last.id)
+
+    friends_href, invites_href = url_for('friends'), url_for('my_invites')
+    avatars: dict[str | None, str] = {}
+    items: list[dict] = []
+    for row in rows:
+        if row.profile_pic not in avatars:
+            avatars[row.profile_pic] = _avatar_url(row.profile_pic, 64)
+        name = row.full_name or row.username
+        item = {
+            "notification_id": row.id,
+            "created_at": row.created_at.isoformat(),
+            "unread": not row.is_read,
+        }
+        if row.kind == "friend_request":
+            item.update({
+                "id": row.ref_id,                    # numeric, matches /accept_request/<id>
+                "type": "friend_request",
+                "sender_name": name,
+                "sender_pic": avatars[row.profile_pic],
+                "href": friends_href,
+            })
+        elif row.kind == "group_invite":
+            item.update({
+                "invite_id": row.ref_id,
+                "type": "group_invite",
+                "group_name": row.group_name,
+                "inviter_name": name,
+                "inviter_pic": avatars[row.profile_pic],
+                "href": invites_href,
+            })
+        else:
+            item.update({"type": row.kind or "message", "message": row.message})
+        items.append(item)
+    return items, next_cursor
 
 @csrf.exempt
 @app.route('/notifications/count')
@@ -590,39 +1505,64 @@ def notifications_count():
     """Lightweight count for the red badge."""
     if 'user_id' not in session:
         return jsonify({"count": 0})
-    # Count pending items from both sources
-    fr_count = FriendRequest.query.filter_by(
-        to_user_id=session['user_id'], status='pending'
-    ).count()
-    gi_count = GroupInvite.query.filter_by(
-        to_user_id=session['user_id'], status='pending'
-    ).count()
-    return jsonify({"count": (fr_count or 0) + (gi_count or 0)})
+    return jsonify({"count": notification_count_for(session['user_id'])})
 
 @csrf.exempt
-@app.route('/notifications/list')
-def notifications_list():
-    """Full list so the dropdown can render details + buttons."""
+@app.route('/notifications/stream')
+def notifications_stream():
+    """
+    Server-Sent Events feed of the badge count. Pushes a `count` event on connect and
+    whenever the inbox changes: straight away for notifications_changed() on this worker,
+    within NOTIF_STREAM_HEARTBEAT seconds for changes made through another worker.
+    Otherwise just a keepalive comment every heartbeat.
+    """
     if 'user_id' not in session:
-        return jsonify([]), 401
+        return jsonify({"error": "Not logged in"}), 401
+
+    user_id = session['user_id']
 
-    items = _pending_notifications(session['user_id'])
+    def inbox_state() -> tuple[int, int]:
+        # short app context per lookup so an idle stream doesn't pin a DB connection
+        with app.app_context():
+            return _inbox_state(user_id)
 
-    # add unread flag using a simple session timestamp
-    seen_iso = session.get('_notif_seen_at')
-    if seen_iso:
+    def generate():
+        yield "retry: 5000\n\n"
+        notification_hub.subscribe(user_id)
         try:
-            seen = datetime.fromisoformat(seen_iso)
-            for it in items:
-                it['unread'] = datetime.fromisoformat(it["created_at"]) > seen
-        except Exception:
-            for it in items:
-                it['unread'] = True
-    else:
-        for it in items:
-            it['unread'] = True
+            cursor, last_state = -1, None
+            deadline = time.monotonic() + NOTIF_STREAM_MAX_AGE
+            while time.monotonic() < deadline:
+                cursor = notification_hub.wait(user_id, cursor, NOTIF_STREAM_HEARTBEAT)
+                # woken or not, the DB decides: a heartbeat picks up other workers' changes
+                state = inbox_state()
+                if state != last_state:
+                    last_state = state
+                    yield f"event: count\ndata: {json.dumps({'count': state[0]})}\n\n"
+                else:
+                    yield ": keepalive\n\n"
+        finally:
+            notification_hub.unsubscribe(user_id)
+
+    return Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-    return jsonify(items), 200
+@csrf.exempt
+@app.route('/notifications/list')
+def notifications_list():
+    """One page of the dropdown feed (details + buttons). Pass ?before=<next_cursor> for the next page."""
+    if 'user_id' not in session:
+        return jsonify({"items": [], "next_cursor": None}), 401
+
+    try:
+        items, next_cursor = _inbox_page(session['user_id'], request.args.get('before'))
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
+
+    return jsonify({"items": items, "next_cursor": next_cursor}), 200
 
 
 @csrf.exempt
@@ -630,7 +1570,15 @@ def notifications_list():
 def notifications_mark_read():
     if 'user_id' not in session:
         return jsonify({"ok": False}), 401
-    session['_notif_seen_at'] = datetime.utcnow().isoformat()
+
+    user_id = session['user_id']
+    db.session.execute(
+        update(Notification)
+        .where(Notification.user_id == user_id, Notification.is_read.is_(False))
+        .values(is_read=True)
+    )
+    db.session.commit()
+    notifications_changed(user_id)
     return jsonify({"ok": True})
 
 
@@ -665,20 +1613,17 @@ def profile():
         if 'profile_pic' in request.files:
             file = request.files['profile_pic']
             if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(filepath)
-                user.profile_pic = filename
-                db.session.commit()
+                try:
+                    user.profile_pic = _save_avatar(file.read())
+                    db.session.commit()
+                    user_index_changed(user)
+                except Exception as e:
+                    db.session.rollback()
+                    print("Avatar upload error:", repr(e))
 
-    transactions = (
-        Transaction.query
-        .filter_by(payer=user.full_name)
-        .order_by(Transaction.date.desc())
-        .all()
-    )
+    transactions, next_cursor = _transaction_page(user.id)
 
-    return render_template("profile.html", user=user, transactions=transactions)
+    return render_template("profile.html", user=user, transactions=transactions, next_cursor=next_cursor)
 
 
 
@@ -693,57 +1638,77 @@ def remove_photo():
     if user:
         user.profile_pic = None
         db.session.commit()
+        user_index_changed(user)
 
     return redirect(url_for("profile"))
 
 
 
 
+_split_preview_cache: OrderedDict[str, list[dict]] = OrderedDict()
+_split_preview_lock = threading.Lock()
+
+
+def _split_preview_key(bills: list[dict]) -> str:
+    """sha256 of the bills with only the fields that affect the split (item names don't)."""
+    fields = ("price", "owners", "split", "weights", "amounts")
+    normalized = [
+        {"paid_by": bill.get("paid_by"),
+         "items": [{k: item.get(k) for k in fields if item.get(k) is not None} for item in bill.get("items") or []]}
+        for bill in bills
+    ]
+    blob = json.dumps(normalized, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+def _preview_splits(bills: list[dict]) -> list[dict]:
+    """split_bills() memoized per normalized payload; previews are re-sent on every owner tweak."""
+    key = _split_preview_key(bills)
+    with _split_preview_lock:
+        if key in _split_preview_cache:
+            _split_preview_cache.move_to_end(key)
+            return _split_preview_cache[key]
+
+    results = split_bills(bills)
+
+    if SPLIT_PREVIEW_CACHE_SIZE > 0:
+        with _split_preview_lock:
+            _split_preview_cache[key] = results
+            while len(_split_preview_cache) > SPLIT_PREVIEW_CACHE_SIZE:
+                _split_preview_cache.popitem(last=False)
+    return results
+
+
 @app.route("/calculate", methods=["POST"])
 @csrf.exempt
 def calculate_split():
+    """
+    Preview a split; never writes. Save it with /confirm_transaction.
+    One bill ({paid_by, items}) -> {reimbursements}, or many at once
+    ({bills: [{paid_by, items}, ...]}) -> {results: [{reimbursements}, ...]}.
+    Items can set "split" to equal / shares / percent / fixed (see splits.py).
+    Amounts are computed in integer cents by splits.split_bills.
+    """
     try:
         data = request.get_json()
-        paid_by = data.get("paid_by")
-        items = data.get("items", [])
-        name_lookup = data.get("name_lookup", {})
-
-        if not paid_by or not items:
+        batch = "bills" in data
+        bills = data.get("bills") if batch else [{"paid_by": data.get("paid_by"), "items": data.get("items", [])}]
+
+        if not isinstance(bills, list) or not bills:
+            return jsonify({"error": "Missing bills"}), 400
+        if len(bills) > SPLIT_BATCH_MAX:
+            return jsonify({"error": f"At most {SPLIT_BATCH_MAX} bills per request"}), 400
+        if any(not bill.get("paid_by") or not bill.get("items") for bill in bills):
             return jsonify({"error": "Missing paid_by or items"}), 400
 
-        balances = {}
-        for item in items:
-            owners = item.get("owners", [])
-            price = float(item.get("price", 0))
-            if not owners or price <= 0:
-                continue
-            split_amount = round(price / len(owners), 2)
-            for owner in owners:
-                if owner == paid_by:
-                    continue
-                balances[owner] = balances.get(owner, 0) + split_amount
-            balances[paid_by] = balances.get(paid_by, 0) - split_amount * len([o for o in owners if o != paid_by])
-
-        for person in balances:
-            balances[person] = round(balances[person], 2)
-
-        user_id = session.get("user_id")
-        if user_id:
-            user = User.query.get(user_id)
-            if paid_by == user.email:
-                total_owed_to_user = sum(
-                    amount for email, amount in balances.items() if email != user.email and amount > 0
-                )
-                if total_owed_to_user > 0:
-                    transaction = Transaction(
-                        payer=user.full_name,
-                        amount=total_owed_to_user,
-                        date=datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
-                    )
-                    db.session.add(transaction)
-                    db.session.commit()
+        try:
+            results = _preview_splits(bills)
+        except SplitError as e:
+            return jsonify({"error": str(e), "reimbursements": {}}), 400
 
-        return jsonify({"reimbursements": balances})
+        if batch:
+            return jsonify({"results": [{"reimbursements": balances} for balances in results]})
+        return jsonify({"reimbursements": results[0]})
 
     except Exception as e:
         return jsonify({"error": str(e), "reimbursements": {}})
@@ -764,8 +1729,16 @@ def save_transaction():
 
     print("Saving transaction with payer:", payer)
 
-    new_txn = Transaction(payer=payer, amount=amount, description=description, date=date)
+    # only link the row to an account when the payer is the signed-in user
+    payer_id = None
+    if session.get("user_id"):
+        me = User.query.get(session["user_id"])
+        if me and payer in (me.full_name, me.email):
+            payer_id = me.id
+
+    new_txn = Transaction(payer=payer, payer_id=payer_id, amount=amount, description=description, date=date)
     db.session.add(new_txn)
+    _bump_user_totals(payer_id, amount)
     db.session.commit()
 
     return jsonify({"status": "success"})
@@ -828,35 +1801,95 @@ def confirm_transaction():
     data = request.get_json()
     paid_by = data["paid_by"]
     items = data["items"]
+    group_id = data.get("group_id") or None
 
     user = User.query.get(session['user_id'])
 
-    total_amount = sum(
-        item.get("price", 0) for item in items
-        if isinstance(item.get("price"), (int, float))
-    )
+    # a saved transaction is money owed to you (it feeds your history and "paid to you"
+    # total), so only bills you paid can be saved
+    if paid_by != user.email:
+        return jsonify({"error": "You can only save bills you paid"}), 400
 
-    description_lines = []
-    for item in items:
-        name = item.get("name")
+    # group bills also move the group's balances, so every person on it must be a member
+    members: dict[str, int] = {}
+    if group_id is not None:
+        try:
+            group_id = int(group_id)
+        except (TypeError, ValueError):
+            return jsonify({"error": "Invalid group_id"}), 400
+        members = dict(
+            db.session.query(User.email, User.id)
+            .join(GroupMember, GroupMember.user_id == User.id)
+            .filter(GroupMember.group_id == group_id)
+            .all()
+        )
+        if user.id not in members.values():
+            return jsonify({"error": "You're not a member of this group"}), 403
+        if paid_by not in members:
+            return jsonify({"error": f"{paid_by} isn't a member of this group"}), 400
+
+    # each owner's cut of each item, honouring the item's split mode (equal/shares/percent/fixed)
+    try:
+        shares = item_shares(items)
+    except SplitError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # the description stays as the human-readable summary shown in history lists;
+    # transaction_item / transaction_item_owner are what the detail view reads
+    description_lines, line_items = [], []
+    group_deltas: dict[int, int] = {}
+    owed_to_payer = 0         # cents; what the others owe you, as /calculate always recorded
+    for position, (item, item_share) in enumerate(zip(items, shares)):
+        name = item.get("name") or ""
         price = float(item.get("price", 0))
-        owners = ", ".join(item.get("owners", []))
-        description_lines.append(f"{name} (${price:.2f}) split between: {owners}")
+        owed: dict[str, float] = {}
+        for owner, amount in zip(item.get("owners") or [], item_share):
+            if owner:
+                owed[owner] = round(owed.get(owner, 0) + amount, 2)
+        description_lines.append(f"{name} (${price:.2f}) split between: {', '.join(owed)}")
+        owed_to_payer += sum(round(amount * 100) for owner, amount in owed.items() if owner != paid_by)
+
+        if group_id is not None:
+            for owner, amount in owed.items():
+                if owner not in members:
+                    return jsonify({"error": f"{owner} isn't a member of this group"}), 400
+                if owner == paid_by:
+                    continue
+                cents = round(amount * 100)
+                group_deltas[members[owner]] = group_deltas.get(members[owner], 0) - cents
+                group_deltas[members[paid_by]] = group_deltas.get(members[paid_by], 0) + cents
+        line_items.append(TransactionItem(
+            position=position,
+            name=name,
+            price=price,
+            owners=[TransactionItemOwner(position=i, owner=o, amount=amount)
+                    for i, (o, amount) in enumerate(owed.items())],
+        ))
     description = "\n".join(description_lines)
 
+    if owed_to_payer <= 0:
+        return jsonify({"error": "Nobody owes you anything on this bill"}), 400
+
     transaction = Transaction(
         payer=user.full_name,  
-        amount=round(total_amount, 2),
+        payer_id=user.id,
+        amount=owed_to_payer / 100,
         date=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        description=description
+        description=description,
+        items=line_items,
+        group_id=group_id,
     )
     db.session.add(transaction)
+    _bump_user_totals(user.id, transaction.amount)
+    if group_id is not None:
+        db.session.flush()
+        _post_group_ledger(group_id, transaction.id, group_deltas)
     db.session.commit()
 
     return jsonify({
         "message": "Transaction saved successfully!",
         "payer": user.full_name,
-        "amount": round(total_amount, 2),
+        "amount": transaction.amount,
         "date": transaction.date
     })
 
@@ -1071,6 +2104,93 @@ def get_group_members(group_id):
         for m in members
     ])
 
+def _apply_group_deltas(group_id: int, deltas: dict[int, int]) -> None:
+    """Adds each member's delta (cents) to their group_balance row in one executemany UPDATE."""
+    deltas = {uid: d for uid, d in deltas.items() if d}
+    if not deltas:
+        return
+
+    existing = set(db.session.scalars(
+        select(GroupBalance.user_id)
+        .where(GroupBalance.group_id == group_id, GroupBalance.user_id.in_(deltas))
+    ))
+    for uid in deltas.keys() - existing:
+        # first balance change for this member; a concurrent request may create it first
+        try:
+            with db.session.begin_nested():
+                db.session.add(GroupBalance(group_id=group_id, user_id=uid, balance_cents=0))
+        except IntegrityError:
+            pass
+
+    balances = GroupBalance.__table__
+    db.session.execute(
+        update(balances)
+        .where(balances.c.group_id == bindparam("b_group"), balances.c.user_id == bindparam("b_user"))
+        .values(balance_cents=balances.c.balance_cents + bindparam("b_delta")),
+        [{"b_group": group_id, "b_user": uid, "b_delta": d} for uid, d in deltas.items()],
+    )
+
+
+def _post_group_ledger(group_id: int, transaction_id: int, deltas: dict[int, int]) -> None:
+    """Records a group transaction's balance changes and applies them, in the caller's DB transaction."""
+    deltas = {uid: d for uid, d in deltas.items() if d}
+    if not deltas:
+        return
+    db.session.execute(insert(GroupLedgerEntry), [
+        {"transaction_id": transaction_id, "group_id": group_id, "user_id": uid, "delta_cents": d}
+        for uid, d in deltas.items()
+    ])
+    _apply_group_deltas(group_id, deltas)
+
+
+def _reverse_group_ledger(transaction_id: int) -> None:
+    """Undoes a group transaction's balance changes and drops its ledger entries."""
+    entries = db.session.execute(
+        select(GroupLedgerEntry.group_id, GroupLedgerEntry.user_id, GroupLedgerEntry.delta_cents)
+        .where(GroupLedgerEntry.transaction_id == transaction_id)
+    ).all()
+    by_group: dict[int, dict[int, int]] = {}
+    for gid, uid, d in entries:
+        group = by_group.setdefault(gid, {})
+        group[uid] = group.get(uid, 0) - d
+    for gid, deltas in by_group.items():
+        _apply_group_deltas(gid, deltas)
+    db.session.execute(delete(GroupLedgerEntry).where(GroupLedgerEntry.transaction_id == transaction_id))
+
+
+@csrf.exempt
+@app.route("/groups/<int:group_id>/settle")
+def group_settle(group_id):
+    """
+    Current net balances for the group and the fewest transfers (greedy, at most n - 1)
+    that square everyone up. Reads the maintained balances; nothing is recomputed.
+    """
+    if "user_id" not in session:
+        return jsonify({"error": "Not logged in"}), 401
+    if not GroupMember.query.filter_by(group_id=group_id, user_id=session["user_id"]).first():
+        return jsonify({"error": "Not a member of this group"}), 403
+
+    rows = (
+        db.session.query(GroupBalance.user_id, GroupBalance.balance_cents, User.full_name, User.email)
+        .join(User, User.id == GroupBalance.user_id)
+        .filter(GroupBalance.group_id == group_id)
+        .all()
+    )
+    people = {uid: {"user_id": uid, "full_name": name, "email": email} for uid, _, name, email in rows}
+    transfers = settle_up({uid: cents for uid, cents, _, _ in rows})
+
+    return jsonify({
+        "balances": [
+            {**people[uid], "balance": round(cents / 100, 2)}
+            for uid, cents, _, _ in sorted(rows, key=lambda r: r[1], reverse=True)
+        ],
+        "transfers": [
+            {"from": people[debtor], "to": people[creditor], "amount": round(cents / 100, 2)}
+            for debtor, creditor, cents in transfers
+        ],
+    })
+
+
 @csrf.exempt
 @app.route("/groups/<int:group_id>/panel")
 def group_panel(group_id):
@@ -1174,7 +2294,9 @@ def leave_group():
     if not group_id or not user_id:
         return jsonify({"error": "Missing data"}), 400
 
-    GroupMember.query.filter_by(group_id=group_id, user_id=user_id).delete()
+    left = GroupMember.query.filter_by(group_id=group_id, user_id=user_id).delete()
+    if left:
+        _suggestions_on_group_leave(user_id, group_id)
     db.session.commit()
     return jsonify({"message": "You left the group."})
 
@@ -1222,10 +2344,12 @@ def accept_group_invite():
     if not exists:
         member = GroupMember(user_id=invite.to_user_id, group_id=invite.group_id)
         db.session.add(member)
+        _suggestions_on_group_join(invite.to_user_id, invite.group_id)
 
     db.session.delete(invite)
+    _resolve_notifications("group_invite", invite.id)
     db.session.commit()
-
+    notifications_changed(session['user_id'])
 
     return jsonify({"success": True})
 
@@ -1266,7 +2390,14 @@ def invite_to_group():
         status='pending'
     )
     db.session.add(invite)
+    db.session.flush()
+    _notify([{
+        "user_id": invitee.id, "kind": "group_invite", "ref_id": invite.id,
+        "actor_id": inviter_id, "message": f"invited you to {group.name}",
+        "created_at": invite.created_at,
+    }])
     db.session.commit()
+    notifications_changed(invitee.id)
 
     return jsonify({"success": True, "message": f"Invite sent to {invitee.username}!"})
 
@@ -1313,21 +2444,115 @@ def decline_invite():
 
     if invite and invite.to_user_id == session.get("user_id"):
         db.session.delete(invite)
+        _resolve_notifications("group_invite", invite.id)
         db.session.commit()
+        notifications_changed(session['user_id'])
 
     return redirect("/my_invites")
 
 
 
 
-@csrf.exempt
-@app.route('/upload_receipt', methods=['POST'])
-def upload_receipt():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
+# Receipt scanning
+RECEIPT_PROMPT = (
+    "You are an expert receipt parser. Extract all line items with names and prices from this receipt. "
+    "Include tax if it's listed as a separate line item. DO NOT include totals, subtotals, change, payment methods, or tips. "
+    "Format the response as a JSON list like: [{\"name\": \"item\", \"price\": 1.23}]. "
+    "If tax is present, include it as an item named 'Tax' at the end of the list."
+)
 
-    user = User.query.get(session['user_id'])
+PRO_MONTHLY_SCAN_LIMIT = 100
+SCAN_JOB_ACTIVE_WINDOW = timedelta(minutes=10)   # queued/running jobs older than this are treated as dead
+SCAN_JOB_RETENTION     = timedelta(days=1)
+
+# Bounded pool for async scans: the OpenAI round-trip runs here instead of on a web worker
+_scan_executor = ThreadPoolExecutor(max_workers=RECEIPT_SCAN_WORKERS, thread_name_prefix="receipt-scan")
+_scan_slots = threading.BoundedSemaphore(RECEIPT_SCAN_MAX_PENDING)
+# Separate pool for batch uploads so one big batch can't starve the async job queue
+_batch_executor = ThreadPoolExecutor(max_workers=RECEIPT_BATCH_WORKERS, thread_name_prefix="receipt-batch")
 
+
+class ReceiptCache:
+    """
+    Parsed item lists keyed by the sha256 of the uploaded image bytes.
+    In-process LRU with a TTL; each web worker keeps its own copy.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: int, charge_hits: bool):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.charge_hits = charge_hits
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[str, tuple[float, list[dict]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key_for(image_bytes: bytes) -> str:
+        return hashlib.sha256(image_bytes).hexdigest()
+
+    def get(self, key: str) -> list[dict] | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and time.monotonic() - entry[0] < self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                # callers mutate items (tax owners), so never hand out the cached list itself
+                return copy.deepcopy(entry[1])
+            if entry:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: str, items: list[dict]) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), copy.deepcopy(items))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits_charged": self.charge_hits,
+            }
+
+
+receipt_cache = ReceiptCache(RECEIPT_CACHE_SIZE, RECEIPT_CACHE_TTL, RECEIPT_CACHE_CHARGE_HITS)
+
+
+class ReceiptScanError(Exception):
+    """A scan failure carrying the message + HTTP status the endpoint should return."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def _active_scan_jobs(user_id: int) -> int:
+    cutoff = datetime.utcnow() - SCAN_JOB_ACTIVE_WINDOW
+    return ReceiptScanJob.query.filter(
+        ReceiptScanJob.user_id == user_id,
+        ReceiptScanJob.status.in_(("queued", "running")),
+        ReceiptScanJob.created_at >= cutoff,
+    ).count()
+
+
+def _check_scan_quota(user: User, scans: int = 1):
+    """Resets the monthly counter if needed. Returns an (error, status) tuple if the user can't make `scans` more scans."""
     now = datetime.now(timezone.utc)
     if user.scan_reset_date is None or now.month != user.scan_reset_date.month or now.year != user.scan_reset_date.year:
         user.scan_count = 0
@@ -1337,66 +2562,166 @@ def upload_receipt():
     if user.subscription_tier == 'free':
         return {"error": "AI receipt uploads are only available on Pro and Pro+ plans."}, 403
 
-    if user.subscription_tier == 'pro' and user.scan_count >= 100:
-        return {"error": "You have reached your monthly limit of 100 AI receipt scans."}, 403
+    if user.subscription_tier == 'pro':
+        # scans still in the queue haven't been charged yet, but they will be
+        used = (user.scan_count or 0) + _active_scan_jobs(user.id)
+        if used >= PRO_MONTHLY_SCAN_LIMIT:
+            return {"error": "You have reached your monthly limit of 100 AI receipt scans."}, 403
+        if used + scans > PRO_MONTHLY_SCAN_LIMIT:
+            return {"error": f"Only {PRO_MONTHLY_SCAN_LIMIT - used} AI receipt scans left this month."}, 403
 
-    if 'receipt' not in request.files:
-        return {"error": "No file uploaded"}, 400
+    return None
+
+
+_preprocess_stats = {"images": 0, "skipped": 0, "bytes_in": 0, "bytes_out": 0}
+_preprocess_lock = threading.Lock()
 
-    file = request.files['receipt']
-    if file.filename == '':
-        return {"error": "Empty filename"}, 400
 
-    image_bytes = file.read()
-    image_base64 = base64.b64encode(image_bytes).decode('utf-8')
+def _record_preprocess(bytes_in: int, bytes_out: int, skipped: bool) -> None:
+    with _preprocess_lock:
+        _preprocess_stats["images"] += 1
+        _preprocess_stats["skipped"] += int(skipped)
+        _preprocess_stats["bytes_in"] += bytes_in
+        _preprocess_stats["bytes_out"] += bytes_out
+
+
+def _receipt_target_size(size: tuple[int, int]) -> tuple[int, int]:
+    w, h = size
+    scale = min(1.0, RECEIPT_IMAGE_MAX_SIDE / max(w, h), RECEIPT_IMAGE_SHORT_SIDE / min(w, h))
+    return max(1, round(w * scale)), max(1, round(h * scale))
+
+
+def _prepare_receipt_image(image_bytes: bytes) -> bytes:
+    """
+    Decode, fix EXIF orientation, optionally grayscale, shrink to what the model
+    actually looks at, and re-encode as JPEG. Falls back to the original bytes if
+    the image can't be decoded or the result isn't smaller.
+    """
+    if not RECEIPT_IMAGE_PREPROCESS:
+        return image_bytes
 
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "You are an expert receipt parser. Extract all line items with names and prices from this receipt. "
-                        "Include tax if it's listed as a separate line item. DO NOT include totals, subtotals, change, payment methods, or tips. "
-                        "Format the response as a JSON list like: [{\"name\": \"item\", \"price\": 1.23}]. "
-                        "If tax is present, include it as an item named 'Tax' at the end of the list."
-                    )
-                },
+        img = Image.open(io.BytesIO(image_bytes))
+        mode = "L" if RECEIPT_IMAGE_GRAYSCALE else "RGB"
+        img.draft(mode, _receipt_target_size(img.size))   # JPEG only: lets libjpeg decode at a reduced size
+        img = ImageOps.exif_transpose(img).convert(mode)
+
+        target = _receipt_target_size(img.size)
+        if img.size != target:
+            img = img.resize(target, Image.LANCZOS)
+
+        out = io.BytesIO()
+        img.save(out, format="JPEG", quality=RECEIPT_IMAGE_QUALITY, optimize=True)
+        processed = out.getvalue()
+    except Exception as e:
+        print("Receipt preprocessing failed, sending original:", repr(e))
+        _record_preprocess(len(image_bytes), len(image_bytes), skipped=True)
+        return image_bytes
+
+    if len(processed) >= len(image_bytes):
+        _record_preprocess(len(image_bytes), len(image_bytes), skipped=True)
+        return image_bytes
+
+    print(f"🧾 Receipt image {len(image_bytes)} -> {len(processed)} bytes ({target[0]}x{target[1]})")
+    _record_preprocess(len(image_bytes), len(processed), skipped=False)
+    return processed
+
+
+def _receipt_messages(image_bytes: bytes) -> list[dict]:
+    image_base64 = base64.b64encode(_prepare_receipt_image(image_bytes)).decode('utf-8')
+    return [
+        {"role": "system", "content": RECEIPT_PROMPT},
+        {
+            "role": "user",
+            "content": [
                 {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{image_base64}"
-                            },
-                        }
-                    ],
+                    "type": "image_url",
+                    "image_url": {
+                        "url": f"data:image/jpeg;base64,{image_base64}"
+                    },
                 }
             ],
-            max_tokens=1000
+        }
+    ]
+
+
+def _call_receipt_model(image_bytes: bytes) -> str:
+    try:
+        response = client.chat.completions.create(
+            model="gpt-4o",
+            messages=_receipt_messages(image_bytes),
+            max_tokens=1000,
+            timeout=RECEIPT_SCAN_TIMEOUT
         )
     except Exception as e:
         print("OpenAI API error:", repr(e))
-        return {"error": "AI parsing failed. Check your API key or try again later."}, 500
+        raise ReceiptScanError("AI parsing failed. Check your API key or try again later.", 500)
 
-    user.scan_count += 1
-    db.session.commit()
+    return response.choices[0].message.content.strip()
 
-    group_id = request.form.get('group_id')
-    if group_id:
-        members = (
-            db.session.query(User)
-            .join(GroupMember)
-            .filter(GroupMember.group_id == group_id)
-            .all()
+
+def _stream_receipt_model(image_bytes: bytes):
+    """Same call as _call_receipt_model but with stream=True; yields text deltas."""
+    try:
+        stream = client.chat.completions.create(
+            model="gpt-4o",
+            messages=_receipt_messages(image_bytes),
+            max_tokens=1000,
+            stream=True
         )
-        friends = [{"email": m.email, "full_name": m.full_name or m.username} for m in members if m.id != user.id]
-    else:
-        friends = [{"email": f.email, "full_name": f.full_name or f.username} for f in user.friends]
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    except Exception as e:
+        print("OpenAI API error:", repr(e))
+        raise ReceiptScanError("AI parsing failed. Check your API key or try again later.", 500)
+
 
-    reply = response.choices[0].message.content.strip()
+class ReceiptItemStream:
+    """
+    Pulls complete {...} objects out of a JSON list as it streams in, so items can
+    be forwarded before the model finishes. Ignores anything outside the objects
+    (code fences, the surrounding brackets, commas).
+    """
+
+    def __init__(self):
+        self._buf: list[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, text: str) -> list[dict]:
+        items = []
+        for ch in text:
+            if self._depth == 0:
+                if ch == "{":
+                    self._depth = 1
+                    self._buf = [ch]
+                continue
+
+            self._buf.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        items.append(json.loads("".join(self._buf)))
+                    except ValueError:
+                        print("Skipping unparseable streamed item:", "".join(self._buf))
+        return items
+
+
+def _parse_receipt_reply(reply: str) -> list[dict]:
     print("🧾 AI raw reply:", reply)
 
     match = re.search(r"```json\s*(.*?)\s*```", reply, re.DOTALL)
@@ -1407,11 +2732,31 @@ def upload_receipt():
     except Exception as e:
         print("Failed to parse AI response:", e)
         print("Raw content received:", cleaned)
-        return {"error": "Could not parse items from receipt."}, 400
+        raise ReceiptScanError("Could not parse items from receipt.")
 
     if not items:
-        return {"error": "No items found in receipt"}, 400
+        raise ReceiptScanError("No items found in receipt")
+    return items
+
+
+def _scan_receipt(image_bytes: bytes) -> list[dict]:
+    """Runs the vision call and returns the parsed item list. Raises ReceiptScanError."""
+    return _parse_receipt_reply(_call_receipt_model(_prepare_receipt_image(image_bytes)))
 
+
+def _receipt_roster(user: User, group_id) -> list[dict]:
+    if group_id:
+        members = (
+            db.session.query(User)
+            .join(GroupMember)
+            .filter(GroupMember.group_id == group_id)
+            .all()
+        )
+        return [{"email": m.email, "full_name": m.full_name or m.username} for m in members if m.id != user.id]
+    return [{"email": f.email, "full_name": f.full_name or f.username} for f in _friends_of(user.id)]
+
+
+def _propagate_tax_owners(items: list[dict]) -> None:
     owners_set = set()
     for item in items:
         if item.get("name", "").lower() != "tax":
@@ -1420,17 +2765,381 @@ def upload_receipt():
         if item.get("name", "").lower() == "tax":
             item["owners"] = list(owners_set)
 
-    total_amount = sum(item["price"] for item in items)
 
+def _receipt_payload(user: User, items: list[dict], group_id) -> dict:
+    _propagate_tax_owners(items)
     return {
         "items": items,
         "user": {
             "email": user.email,
             "full_name": user.full_name or user.username
         },
-        "friends": friends,
-        "total_amount": total_amount
+        "friends": _receipt_roster(user, group_id),
+        "total_amount": sum(item["price"] for item in items)
     }
 
+
+def _run_scan_job(job_id: str, image_bytes: bytes, cache_key: str) -> None:
+    """Worker-thread body: make the OpenAI call, store the result, charge the scan on success."""
+    try:
+        with app.app_context():
+            job = db.session.get(ReceiptScanJob, job_id)
+            if not job:
+                return
+            job.status = "running"
+            db.session.commit()
+
+            try:
+                items = _scan_receipt(image_bytes)
+            except ReceiptScanError as e:
+                job.status = "failed"
+                job.error = e.message
+                job.finished_at = datetime.utcnow()
+                db.session.commit()
+                return
+
+            receipt_cache.put(cache_key, items)
+            user = db.session.get(User, job.user_id)
+            user.scan_count = (user.scan_count or 0) + 1
+            job.status = "done"
+            job.result = json.dumps(items)
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+    except Exception as e:
+        print("Receipt scan job error:", repr(e))
+        _fail_scan_job(job_id, "Receipt scan failed. Please try again.")
+    finally:
+        _scan_slots.release()
+
+
+def _fail_scan_job(job_id: str, error: str) -> None:
+    """Marks a job failed after an unexpected error, so its poller stops waiting."""
+    try:
+        with app.app_context():
+            db.session.rollback()
+            db.session.execute(
+                update(ReceiptScanJob)
+                .where(ReceiptScanJob.id == job_id, ReceiptScanJob.status.in_(("queued", "running")))
+                .values(status="failed", error=error, finished_at=datetime.utcnow())
+            )
+            db.session.commit()
+    except Exception as e:
+        print("Receipt scan job error (marking failed):", repr(e))
+
+
+def _enqueue_scan_job(user: User, image_bytes: bytes, cache_key: str, group_id):
+    if not _scan_slots.acquire(blocking=False):
+        return {"error": "Receipt scanner is busy. Please try again in a moment."}, 503
+
+    try:
+        # opportunistic cleanup so the table doesn't grow forever
+        ReceiptScanJob.query.filter(
+            ReceiptScanJob.created_at < datetime.utcnow() - SCAN_JOB_RETENTION
+        ).delete(synchronize_session=False)
+
+        job = ReceiptScanJob(
+            id=uuid.uuid4().hex,
+            user_id=user.id,
+            group_id=int(group_id) if group_id else None,
+            status="queued",
+        )
+        db.session.add(job)
+        db.session.commit()
+        _scan_executor.submit(_run_scan_job, job.id, image_bytes, cache_key)
+    except Exception:
+        _scan_slots.release()
+        raise
+
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": url_for('receipt_job_status', job_id=job.id),
+    }, 202
+
+
+def _receipt_upload_error(user: User):
+    """Quota + file checks shared by the receipt endpoints. Returns an (error, status) tuple or None."""
+    quota_error = _check_scan_quota(user)
+    if quota_error:
+        return quota_error
+
+    if 'receipt' not in request.files:
+        return {"error": "No file uploaded"}, 400
+
+    if request.files['receipt'].filename == '':
+        return {"error": "Empty filename"}, 400
+
+    return None
+
+
+@csrf.exempt
+@app.route('/upload_receipt', methods=['POST'])
+def upload_receipt():
+    if 'user_id' not in session:
+        return redirect(url_for('login'))
+
+    user = User.query.get(session['user_id'])
+
+    upload_error = _receipt_upload_error(user)
+    if upload_error:
+        return upload_error
+
+    image_bytes = request.files['receipt'].read()
+    group_id = request.form.get('group_id')
+
+    # Same photo uploaded again -> reuse the parsed items, no OpenAI call
+    cache_key = receipt_cache.key_for(image_bytes)
+    items = receipt_cache.get(cache_key)
+    if items is not None:
+        if receipt_cache.charge_hits:
+            user.scan_count += 1
+            db.session.commit()
+        payload = _receipt_payload(user, items, group_id)
+        payload["cache"] = {"hit": True, "charged": receipt_cache.charge_hits}
+        return payload
+
+    # ?mode=async (or RECEIPT_SCAN_MODE=async) hands the OpenAI call to the scan pool
+    mode = (request.form.get('mode') or request.args.get('mode') or RECEIPT_SCAN_MODE).lower()
+    if mode == "async":
+        return _enqueue_scan_job(user, image_bytes, cache_key, group_id)
+
+    try:
+        items = _scan_receipt(image_bytes)
+    except ReceiptScanError as e:
+        return {"error": e.message}, e.status
+
+    receipt_cache.put(cache_key, items)
+    user.scan_count += 1
+    db.session.commit()
+
+    payload = _receipt_payload(user, items, group_id)
+    payload["cache"] = {"hit": False, "charged": True}
+    return payload
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@csrf.exempt
+@app.route('/upload_receipt/stream', methods=['POST'])
+def upload_receipt_stream():
+    """
+    Streaming variant of /upload_receipt. Responds with Server-Sent Events:
+    `meta` (user + roster), one `item` per parsed line item as the model emits it,
+    then `done` (total, tax owners, cache info) or `error`.
+    """
+    if 'user_id' not in session:
+        return {"error": "Not logged in"}, 401
+
+    user = User.query.get(session['user_id'])
+
+    upload_error = _receipt_upload_error(user)
+    if upload_error:
+        return upload_error
+
+    image_bytes = request.files['receipt'].read()
+    group_id = request.form.get('group_id')
+    cache_key = receipt_cache.key_for(image_bytes)
+    cached = receipt_cache.get(cache_key)
+
+    # the generator runs after the view returns, so grab everything request-bound up front
+    user_id = user.id
+    meta = {
+        "user": {"email": user.email, "full_name": user.full_name or user.username},
+        "friends": _receipt_roster(user, group_id),
+    }
+
+    def generate():
+        yield _sse("meta", meta)
+
+        items = []
+        if cached is not None:
+            items = cached
+            for item in items:
+                yield _sse("item", item)
+            charged = receipt_cache.charge_hits
+        else:
+            parser = ReceiptItemStream()
+            reply = []
+            try:
+                for delta in _stream_receipt_model(image_bytes):
+                    reply.append(delta)
+                    for item in parser.feed(delta):
+                        items.append(item)
+                        yield _sse("item", item)
+
+                if not items:
+                    # the model didn't answer with a list of objects; let the normal parser decide
+                    items = _parse_receipt_reply("".join(reply).strip())
+                    for item in items:
+                        yield _sse("item", item)
+            except ReceiptScanError as e:
+                yield _sse("error", {"error": e.message})
+                return
+
+            receipt_cache.put(cache_key, items)
+            charged = True
+
+        if charged:
+            scanner = db.session.get(User, user_id)
+            scanner.scan_count = (scanner.scan_count or 0) + 1
+            db.session.commit()
+
+        _propagate_tax_owners(items)
+        yield _sse("done", {
+            "total_amount": sum(item["price"] for item in items),
+            "count": len(items),
+            "tax_owners": next((i["owners"] for i in items if i.get("name", "").lower() == "tax"), []),
+            "cache": {"hit": cached is not None, "charged": charged},
+        })
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@csrf.exempt
+@app.route('/upload_receipt/batch', methods=['POST'])
+def upload_receipt_batch():
+    """
+    Many receipts in one multipart request (field `receipts`, repeated).
+    Cache misses are parsed concurrently on a bounded pool; quota and roster are checked
+    once for the whole batch, tax owners are propagated per receipt. Identical photos are
+    parsed and charged once.
+    """
+    if 'user_id' not in session:
+        return {"error": "Not logged in"}, 401
+
+    user = User.query.get(session['user_id'])
+
+    files = [f for f in request.files.getlist('receipts') if f and f.filename]
+    if not files:
+        return {"error": "No files uploaded"}, 400
+    if len(files) > RECEIPT_BATCH_MAX:
+        return {"error": f"You can upload at most {RECEIPT_BATCH_MAX} receipts at once."}, 400
+
+    uploads = [(f.filename, f.read()) for f in files]
+    keys = [receipt_cache.key_for(image_bytes) for _, image_bytes in uploads]
+    cached = [receipt_cache.get(key) for key in keys]
+
+    # identical photos in one batch are parsed (and charged) once, cache hits included
+    to_scan = {keys[i]: image_bytes for i, (_, image_bytes) in enumerate(uploads) if cached[i] is None}
+    hit_keys = {keys[i] for i in range(len(uploads)) if cached[i] is not None}
+    charged_hits = len(hit_keys) if receipt_cache.charge_hits else 0
+    quota_error = _check_scan_quota(user, len(to_scan) + charged_hits)
+    if quota_error:
+        return quota_error
+
+    futures = {key: _batch_executor.submit(_scan_receipt, image_bytes) for key, image_bytes in to_scan.items()}
+    # requests queue behind each other in the pool, so the deadline grows with the number of rounds
+    deadline = time.monotonic() + RECEIPT_SCAN_TIMEOUT * max(1, math.ceil(len(futures) / RECEIPT_BATCH_WORKERS))
+    wait(futures.values(), timeout=max(0, deadline - time.monotonic()))
+
+    results = {}
+    for key, future in futures.items():
+        if not future.done():
+            future.cancel()
+            results[key] = "Timed out while parsing this receipt."
+            continue
+        try:
+            results[key] = future.result()
+            receipt_cache.put(key, results[key])
+        except ReceiptScanError as e:
+            results[key] = e.message
+        except Exception as e:
+            print("Batch receipt error:", repr(e))
+            results[key] = "AI parsing failed. Check your API key or try again later."
+    charged = charged_hits + sum(1 for r in results.values() if isinstance(r, list))
+
+    receipts, merged, seen = [], [], set()
+    for i, (filename, _) in enumerate(uploads):
+        entry = {"index": i, "filename": filename}
+        if cached[i] is not None:
+            items = copy.deepcopy(cached[i])
+            entry["cache"] = {"hit": True, "charged": receipt_cache.charge_hits and keys[i] not in seen}
+        else:
+            result = results[keys[i]]
+            if isinstance(result, str):
+                entry["error"] = result
+                receipts.append(entry)
+                continue
+            items = copy.deepcopy(result)
+            entry["cache"] = {"hit": False, "charged": keys[i] not in seen}
+        seen.add(keys[i])
+
+        # a receipt's tax line is split among that receipt's owners only
+        _propagate_tax_owners(items)
+        for item in items:
+            item["receipt"] = i
+        entry["items"] = items
+        entry["total_amount"] = sum(item["price"] for item in items)
+        receipts.append(entry)
+        merged.extend(items)
+
+    if charged:
+        user.scan_count = (user.scan_count or 0) + charged
+        db.session.commit()
+
+    return {
+        "receipts": receipts,
+        "user": {
+            "email": user.email,
+            "full_name": user.full_name or user.username
+        },
+        "friends": _receipt_roster(user, request.form.get('group_id')),
+        "total_amount": sum(item["price"] for item in merged),
+        "scans_charged": charged,
+    }
+
+
+@csrf.exempt
+@app.route('/upload_receipt/jobs/<job_id>')
+def receipt_job_status(job_id):
+    if 'user_id' not in session:
+        return {"error": "Not logged in"}, 401
+
+    job = db.session.get(ReceiptScanJob, job_id)
+    if not job or job.user_id != session['user_id']:
+        return {"error": "Job not found"}, 404
+
+    if job.status == "done":
+        user = User.query.get(job.user_id)
+        payload = _receipt_payload(user, json.loads(job.result), job.group_id)
+        payload.update({"job_id": job.id, "status": job.status})
+        return payload
+
+    if job.status in ("queued", "running") and job.created_at < datetime.utcnow() - SCAN_JOB_ACTIVE_WINDOW:
+        # the worker died or restarted mid-scan; nothing will ever finish this job
+        job.status = "failed"
+        job.error = "Receipt scan timed out. Please try again."
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+
+    if job.status == "failed":
+        return {"job_id": job.id, "status": job.status, "error": job.error}
+
+    return {"job_id": job.id, "status": job.status}
+
+@csrf.exempt
+@app.route('/upload_receipt/cache_stats')
+def receipt_cache_stats():
+    if 'user_id' not in session:
+        return {"error": "Not logged in"}, 401
+    return receipt_cache.stats()
+
+@csrf.exempt
+@app.route('/upload_receipt/preprocess_stats')
+def receipt_preprocess_stats():
+    if 'user_id' not in session:
+        return {"error": "Not logged in"}, 401
+    with _preprocess_lock:
+        stats = dict(_preprocess_stats)
+    stats["bytes_saved"] = stats["bytes_in"] - stats["bytes_out"]
+    stats["enabled"] = RECEIPT_IMAGE_PREPROCESS
+    return stats
+
 if __name__ == "__main__":
     app.run(debug=True)
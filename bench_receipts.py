@@ -0,0 +1,296 @@
+"""
+Load benchmark for the receipt-scan path, run against fake_openai.py so it
+costs nothing and doesn't need the network.
+
+    python bench_receipts.py --modes sync,async,stream,batch --concurrency 1,8,32 --scans 64 --workers 4
+
+Everything runs in-process: the fake OpenAI server, and the SplitPay app on a
+throwaway SQLite DB. --workers caps how many requests the app serves at once,
+the same way a pool of gunicorn sync workers does, so the numbers show how
+scans compete with normal traffic. A probe thread loads /pricing during every
+run to measure that.
+
+For each mode/concurrency pair it reports receipt throughput and p50/p95/p99
+end-to-end scan latency (for async that's submit -> job done).
+"""
+import argparse, contextlib, http.cookiejar, io, json, logging, os, random, sys, tempfile, threading, time, uuid
+import urllib.parse, urllib.request
+
+from werkzeug.serving import make_server
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+class WorkerLimit:
+    """WSGI middleware: at most `workers` requests in flight, held until the body is fully sent."""
+
+    def __init__(self, app, workers):
+        self.app = app
+        self.slots = threading.Semaphore(workers)
+
+    def __call__(self, environ, start_response):
+        self.slots.acquire()
+        try:
+            result = self.app(environ, start_response)
+        except Exception:
+            self.slots.release()
+            raise
+        return _ReleaseOnClose(result, self.slots.release)
+
+
+class _ReleaseOnClose:
+    def __init__(self, result, release):
+        self.result = result
+        self._release = release
+        self._released = False
+
+    def __iter__(self):
+        return iter(self.result)
+
+    def close(self):
+        try:
+            if hasattr(self.result, "close"):
+                self.result.close()
+        finally:
+            if not self._released:
+                self._released = True
+                self._release()
+
+
+def serve(wsgi_app):
+    server = make_server("127.0.0.1", 0, wsgi_app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def sample_receipts(count=4):
+    """A few real JPEGs so the preprocessing stage does its normal amount of work."""
+    from PIL import Image, ImageDraw
+
+    images = []
+    for n in range(count):
+        img = Image.new("RGB", (2400, 3600), "white")
+        draw = ImageDraw.Draw(img)
+        for y in range(200, 3400, 90):
+            draw.text((200, y), f"ITEM {n}-{y}    {random.uniform(1, 30):.2f}", fill="black")
+        out = io.BytesIO()
+        img.save(out, format="JPEG", quality=92)
+        images.append(out.getvalue())
+    return images
+
+
+def unique(image_bytes):
+    # bytes after the JPEG end marker are ignored by decoders but change the content hash,
+    # so every scan misses the receipt cache
+    return image_bytes + uuid.uuid4().bytes
+
+
+def multipart(fields, files):
+    boundary = uuid.uuid4().hex
+    out = io.BytesIO()
+    for name, value in fields.items():
+        out.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, filename, data in files:
+        out.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                  f'Content-Type: image/jpeg\r\n\r\n'.encode())
+        out.write(data)
+        out.write(b"\r\n")
+    out.write(f"--{boundary}--\r\n".encode())
+    return out.getvalue(), f"multipart/form-data; boundary={boundary}"
+
+
+class Scanner:
+    """One logged-in browser session."""
+
+    def __init__(self, base_url, email, password):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+        login = urllib.parse.urlencode({"email": email, "password": password}).encode()
+        with self.opener.open(self._req("/login", login, "application/x-www-form-urlencoded"), timeout=60) as res:
+            res.read()
+
+    def _req(self, path, body=None, content_type=None):
+        req = urllib.request.Request(self.base_url + path, data=body)
+        if content_type:
+            req.add_header("Content-Type", content_type)
+        return req
+
+    def _post(self, path, fields, files):
+        body, ctype = multipart(fields, files)
+        with self.opener.open(self._req(path, body, ctype), timeout=300) as res:
+            return res.read()
+
+    def scan(self, mode, images, batch_size):
+        """Runs one scan request in the given mode. Returns the number of receipts parsed."""
+        if mode == "batch":
+            files = [("receipts", f"r{i}.jpg", unique(random.choice(images))) for i in range(batch_size)]
+            data = json.loads(self._post("/upload_receipt/batch", {}, files))
+            if "error" in data:
+                raise RuntimeError(data["error"])
+            return sum(1 for r in data["receipts"] if "items" in r)
+
+        files = [("receipt", "r.jpg", unique(random.choice(images)))]
+        if mode == "stream":
+            body = self._post("/upload_receipt/stream", {}, files).decode()
+            if "event: done" not in body:
+                raise RuntimeError("stream ended without a done event")
+            return 1
+
+        data = json.loads(self._post("/upload_receipt", {"mode": mode}, files))
+        if "error" in data:
+            raise RuntimeError(data["error"])
+        if mode == "async" and "status_url" in data:
+            status_url = data["status_url"]
+            while data.get("status") != "done":
+                time.sleep(0.25)
+                with self.opener.open(self._req(status_url), timeout=60) as res:
+                    data = json.loads(res.read())
+                if data.get("error"):
+                    raise RuntimeError(data["error"])
+        return 1
+
+
+def run(base_url, mode, concurrency, scans, batch_size, images):
+    remaining = [scans]
+    lock = threading.Lock()
+    latencies, errors, receipts = [], [], [0]
+
+    def take():
+        with lock:
+            if remaining[0] <= 0:
+                return False
+            remaining[0] -= 1
+            return True
+
+    def worker():
+        scanner = Scanner(base_url, "bench@example.com", "bench")
+        while take():
+            t0 = time.perf_counter()
+            try:
+                parsed = scanner.scan(mode, images, batch_size)
+            except Exception as e:
+                with lock:
+                    errors.append(repr(e))
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - t0)
+                receipts[0] += parsed
+
+    probe_latencies, stop = [], threading.Event()
+
+    def probe():
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            try:
+                with urllib.request.urlopen(base_url + "/pricing", timeout=120) as res:
+                    res.read()
+                probe_latencies.append(time.perf_counter() - t0)
+            except Exception:
+                pass
+            stop.wait(0.1)
+
+    probe_thread = threading.Thread(target=probe, daemon=True)
+    probe_thread.start()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    probe_thread.join()
+
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "ok": len(latencies),
+        "errors": len(errors),
+        "receipts_per_s": receipts[0] / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "page_p95": percentile(probe_latencies, 95),
+        "first_error": errors[0] if errors else "",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", default="sync,async,stream,batch")
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated scanner counts")
+    parser.add_argument("--scans", type=int, default=64, help="requests per mode/concurrency run")
+    parser.add_argument("--batch-size", type=int, default=5, help="receipts per request in batch mode")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent requests the app will serve (gunicorn -w)")
+    parser.add_argument("--latency-ms", type=float, default=1500)
+    parser.add_argument("--jitter-ms", type=float, default=500)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--fenced-rate", type=float, default=0.5)
+    parser.add_argument("--json", action="store_true", help="print results as JSON lines")
+    args = parser.parse_args()
+
+    import fake_openai
+    fake = fake_openai.create_app(fake_openai.FakeConfig(
+        args.latency_ms, args.jitter_ms, args.error_rate, fenced_rate=args.fenced_rate, seed=1))
+    fake_server, fake_url = serve(fake)
+
+    # app.py reads its config at import time, so set everything up before importing it
+    db_file = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+    os.environ.update({
+        "ENV_FILE": os.devnull,
+        "OPENAI_API_KEY": "fake",
+        "OPENAI_BASE_URL": fake_url + "/v1",
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///" + db_file.name,
+    })
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as splitpay
+    from models import db, User
+    from werkzeug.security import generate_password_hash
+
+    with splitpay.app.app_context():
+        db.create_all()
+        db.session.add(User(full_name="Bench User", username="bench", email="bench@example.com",
+                            password=generate_password_hash("bench"), subscription_tier="pro_plus"))
+        db.session.commit()
+
+    app_server, app_url = serve(WorkerLimit(splitpay.app, args.workers))
+    images = sample_receipts()
+
+    # the app and both servers log every request; keep the report readable
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    report = sys.stdout
+    quiet = contextlib.redirect_stdout(open(os.devnull, "w"))
+
+    if not args.json:
+        print(f"fake OpenAI latency {args.latency_ms:.0f}±{args.jitter_ms:.0f} ms, "
+              f"error rate {args.error_rate:.0%}, app workers {args.workers}")
+        print(f"{'mode':<7} {'conc':>5} {'ok':>5} {'err':>4} {'rcpt/s':>8} "
+              f"{'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'page p95':>9}")
+
+    try:
+        for mode in [m.strip() for m in args.modes.split(",") if m.strip()]:
+            for concurrency in [int(c) for c in args.concurrency.split(",") if c.strip()]:
+                with quiet:
+                    r = run(app_url, mode, concurrency, args.scans, args.batch_size, images)
+                if args.json:
+                    print(json.dumps(r), file=report, flush=True)
+                    continue
+                print(f"{r['mode']:<7} {r['concurrency']:>5} {r['ok']:>5} {r['errors']:>4} {r['receipts_per_s']:>8.2f} "
+                      f"{r['p50']:>7.2f} {r['p95']:>7.2f} {r['p99']:>7.2f} {r['page_p95']:>9.2f}", file=report, flush=True)
+                if r["first_error"]:
+                    print(f"        first error: {r['first_error']}", file=report, flush=True)
+    finally:
+        app_server.shutdown()
+        fake_server.shutdown()
+        os.unlink(db_file.name)
+
+
+if __name__ == "__main__":
+    main()
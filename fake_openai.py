@@ -0,0 +1,137 @@
+"""
+Local stand-in for the OpenAI chat-completions endpoint, for load testing the
+receipt scanner without spending money or touching the network.
+
+    python fake_openai.py --port 8765 --latency-ms 2500 --error-rate 0.02
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=fake flask run
+
+Every request gets a canned receipt reply (a JSON list of items, sometimes
+wrapped in a ```json fence the way gpt-4o likes to answer). Supports
+stream=True with the same SSE chunk format as the real API.
+"""
+import argparse, json, random, time, threading, uuid
+
+from flask import Flask, Response, jsonify, request
+
+
+MENU = [
+    ("Cheeseburger", 12.49), ("Caesar Salad", 9.75), ("Fries", 4.25), ("Chicken Wings", 13.99),
+    ("Margherita Pizza", 16.50), ("Iced Tea", 3.25), ("Draft Beer", 7.00), ("Fish Tacos", 14.25),
+    ("Onion Rings", 5.49), ("Chocolate Cake", 8.00), ("Sparkling Water", 2.99), ("Pad Thai", 15.75),
+    ("Bananas 2 lb", 1.18), ("Whole Milk 1 gal", 4.29), ("Eggs, Large (12)", 3.89), ("Sourdough Bread", 5.99),
+]
+
+
+class FakeConfig:
+    def __init__(self, latency_ms=1500, jitter_ms=500, error_rate=0.0, error_status=500,
+                 fenced_rate=0.5, min_items=3, max_items=12, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.fenced_rate = fenced_rate
+        self.min_items = min_items
+        self.max_items = max_items
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    def roll(self):
+        """Returns (latency seconds, should_fail, reply text) for one request."""
+        with self.lock:
+            self.requests += 1
+            delay = max(0, self.latency_ms + self.rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            fail = self.rng.random() < self.error_rate
+            if fail:
+                self.errors += 1
+            count = self.rng.randint(self.min_items, self.max_items)
+            items = [{"name": n, "price": p} for n, p in self.rng.sample(MENU, min(count, len(MENU)))]
+            fenced = self.rng.random() < self.fenced_rate
+
+        subtotal = sum(i["price"] for i in items)
+        items.append({"name": "Tax", "price": round(subtotal * 0.0825, 2)})
+        body = json.dumps(items, indent=2)
+        return delay, fail, (f"```json\n{body}\n```" if fenced else body)
+
+
+def create_app(config: FakeConfig) -> Flask:
+    app = Flask(__name__)
+
+    def completion_id():
+        return "chatcmpl-" + uuid.uuid4().hex[:24]
+
+    @app.route("/v1/chat/completions", methods=["POST"])
+    def chat_completions():
+        payload = request.get_json(silent=True) or {}
+        model = payload.get("model", "gpt-4o")
+        delay, fail, reply = config.roll()
+
+        if fail:
+            time.sleep(delay / 4)
+            return jsonify({"error": {"message": "Injected failure", "type": "server_error"}}), config.error_status
+
+        if payload.get("stream"):
+            cid, created = completion_id(), int(time.time())
+
+            def chunk(delta, finish=None):
+                return "data: " + json.dumps({
+                    "id": cid, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+                }) + "\n\n"
+
+            def generate():
+                # first token after ~30% of the latency, the rest spread over the remainder
+                time.sleep(delay * 0.3)
+                yield chunk({"role": "assistant", "content": ""})
+                pieces = [reply[i:i + 24] for i in range(0, len(reply), 24)]
+                for piece in pieces:
+                    time.sleep(delay * 0.7 / len(pieces))
+                    yield chunk({"content": piece})
+                yield chunk({}, "stop")
+                yield "data: [DONE]\n\n"
+
+            return Response(generate(), mimetype="text/event-stream")
+
+        time.sleep(delay)
+        return jsonify({
+            "id": completion_id(),
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": reply},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 800, "completion_tokens": len(reply) // 4, "total_tokens": 800 + len(reply) // 4},
+        })
+
+    @app.route("/stats")
+    def stats():
+        return jsonify({"requests": config.requests, "errors": config.errors})
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=1500)
+    parser.add_argument("--jitter-ms", type=float, default=500)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail (0-1)")
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--fenced-rate", type=float, default=0.5, help="fraction of replies wrapped in ```json fences")
+    parser.add_argument("--min-items", type=int, default=3)
+    parser.add_argument("--max-items", type=int, default=12)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    config = FakeConfig(args.latency_ms, args.jitter_ms, args.error_rate, args.error_status,
+                        args.fenced_rate, args.min_items, args.max_items, args.seed)
+    create_app(config).run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
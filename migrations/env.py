@@ -51,6 +51,18 @@ def get_metadata():
     return target_db.metadata
 
 
+# Search objects created by raw SQL in 1b7d4e9a2c60 that the models don't describe: the FTS5
+# table user_search plus its shadow tables (user_search_data, _idx, _config, _docsize) on
+# SQLite, and the pg_trgm GIN indexes on Postgres. Without this, autogenerate emits drops.
+def include_object(object, name, type_, reflected, compare_to):
+    if reflected and compare_to is None:
+        if type_ == "table" and name.startswith("user_search"):
+            return False
+        if type_ == "index" and name in ("ix_user_full_name_trgm", "ix_user_username_trgm"):
+            return False
+    return True
+
+
 def run_migrations_offline():
     """Run migrations in 'offline' mode.
 
@@ -65,7 +77,8 @@ def run_migrations_offline():
     """
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
-        url=url, target_metadata=get_metadata(), literal_binds=True
+        url=url, target_metadata=get_metadata(), literal_binds=True,
+        include_object=include_object
     )
 
     with context.begin_transaction():
@@ -93,6 +106,8 @@ def run_migrations_online():
     conf_args = current_app.extensions['migrate'].configure_args
     if conf_args.get("process_revision_directives") is None:
         conf_args["process_revision_directives"] = process_revision_directives
+    if conf_args.get("include_object") is None:
+        conf_args["include_object"] = include_object
 
     connectable = get_engine()
 
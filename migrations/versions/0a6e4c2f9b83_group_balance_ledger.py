@@ -0,0 +1,57 @@
+"""group balance ledger: transaction.group_id, group_ledger_entry, group_balance
+
+Revision ID: 0a6e4c2f9b83
+Revises: f3c8d0a6b215
+Create Date: 2026-10-18 15:12:44.019337
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0a6e4c2f9b83'
+down_revision = 'f3c8d0a6b215'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('transaction') as batch_op:
+        batch_op.add_column(sa.Column('group_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_transaction_group_id_group', 'group', ['group_id'], ['id'])
+    op.create_index('ix_transaction_group_id', 'transaction', ['group_id'])
+
+    op.create_table(
+        'group_balance',
+        sa.Column('group_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('balance_cents', sa.BigInteger(), nullable=False),
+        sa.ForeignKeyConstraint(['group_id'], ['group.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+        sa.PrimaryKeyConstraint('group_id', 'user_id'),
+    )
+    op.create_table(
+        'group_ledger_entry',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('transaction_id', sa.Integer(), nullable=False),
+        sa.Column('group_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('delta_cents', sa.BigInteger(), nullable=False),
+        sa.ForeignKeyConstraint(['transaction_id'], ['transaction.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['group_id'], ['group.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_group_ledger_entry_transaction_id', 'group_ledger_entry', ['transaction_id'])
+    # existing transactions were never tied to a group, so there is nothing to backfill
+
+
+def downgrade():
+    op.drop_index('ix_group_ledger_entry_transaction_id', table_name='group_ledger_entry')
+    op.drop_table('group_ledger_entry')
+    op.drop_table('group_balance')
+    op.drop_index('ix_transaction_group_id', table_name='transaction')
+    with op.batch_alter_table('transaction') as batch_op:
+        batch_op.drop_constraint('fk_transaction_group_id_group', type_='foreignkey')
+        batch_op.drop_column('group_id')
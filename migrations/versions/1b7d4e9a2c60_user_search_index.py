@@ -0,0 +1,86 @@
+"""user search index: FTS5 trigram table + triggers on SQLite, pg_trgm GIN indexes on Postgres
+
+Revision ID: 1b7d4e9a2c60
+Revises: 0a6e4c2f9b83
+Create Date: 2026-10-18 14:41:08.316590
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '1b7d4e9a2c60'
+down_revision = '0a6e4c2f9b83'
+branch_labels = None
+depends_on = None
+
+
+# The FTS table is an external-content index over "user" (it stores no copy of the rows), so
+# the triggers have to keep it in step. The trigram tokenizer needs SQLite 3.34+ and matches
+# substrings case-insensitively, which is what the old ILIKE '%q%' did.
+#
+# Note: batch_alter_table on "user" recreates the table on SQLite and drops these triggers;
+# a migration that does that must call create_sqlite_triggers() again afterwards.
+SQLITE_TRIGGERS = [
+    """
+    CREATE TRIGGER user_search_ai AFTER INSERT ON "user" BEGIN
+        INSERT INTO user_search (rowid, full_name, username) VALUES (new.id, new.full_name, new.username);
+    END
+    """,
+    """
+    CREATE TRIGGER user_search_ad AFTER DELETE ON "user" BEGIN
+        INSERT INTO user_search (user_search, rowid, full_name, username)
+        VALUES ('delete', old.id, old.full_name, old.username);
+    END
+    """,
+    """
+    CREATE TRIGGER user_search_au AFTER UPDATE OF full_name, username ON "user" BEGIN
+        INSERT INTO user_search (user_search, rowid, full_name, username)
+        VALUES ('delete', old.id, old.full_name, old.username);
+        INSERT INTO user_search (rowid, full_name, username) VALUES (new.id, new.full_name, new.username);
+    END
+    """,
+]
+
+
+def create_sqlite_triggers():
+    for ddl in SQLITE_TRIGGERS:
+        op.execute(ddl)
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+
+    if dialect == 'sqlite':
+        op.execute("""
+            CREATE VIRTUAL TABLE user_search USING fts5(
+                full_name, username,
+                content='user', content_rowid='id',
+                tokenize='trigram'
+            )
+        """)
+        create_sqlite_triggers()
+        op.execute("INSERT INTO user_search (user_search) VALUES ('rebuild')")
+
+    elif dialect == 'postgresql':
+        # GIN trigram indexes serve ILIKE '%q%' directly; Postgres keeps them up to date
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.execute('CREATE INDEX ix_user_full_name_trgm ON "user" USING gin (full_name gin_trgm_ops)')
+        op.execute('CREATE INDEX ix_user_username_trgm ON "user" USING gin (username gin_trgm_ops)')
+
+    else:
+        print(f"user search index: no index for dialect {dialect!r}, search stays on ILIKE")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+
+    if dialect == 'sqlite':
+        for name in ('user_search_ai', 'user_search_ad', 'user_search_au'):
+            op.execute(f'DROP TRIGGER IF EXISTS {name}')
+        op.execute('DROP TABLE IF EXISTS user_search')
+
+    elif dialect == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_user_username_trgm')
+        op.execute('DROP INDEX IF EXISTS ix_user_full_name_trgm')
+        # pg_trgm is left installed; other objects may depend on it
@@ -0,0 +1,38 @@
+"""add receipt_scan_job table for async receipt scans
+
+Revision ID: 3f1a9c2d7b10
+Revises: abcfeb61e94a
+Create Date: 2026-10-18 09:12:04.118230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1a9c2d7b10'
+down_revision = 'abcfeb61e94a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'receipt_scan_job',
+        sa.Column('id', sa.String(length=32), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('group_id', sa.Integer(), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('result', sa.Text(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_receipt_scan_job_user_id', 'receipt_scan_job', ['user_id'])
+
+
+def downgrade():
+    op.drop_index('ix_receipt_scan_job_user_id', table_name='receipt_scan_job')
+    op.drop_table('receipt_scan_job')
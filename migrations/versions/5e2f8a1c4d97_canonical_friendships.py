@@ -0,0 +1,71 @@
+"""friendships: one (lower id, higher id) row per pair with a composite PK + reverse index
+
+Revision ID: 5e2f8a1c4d97
+Revises: 1b7d4e9a2c60
+Create Date: 2026-10-18 15:36:42.208115
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import text
+
+
+# revision identifiers, used by Alembic.
+revision = '5e2f8a1c4d97'
+down_revision = '1b7d4e9a2c60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+
+    op.create_table(
+        'friendships_new',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('friend_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], name='fk_friendships_user_id_user'),
+        sa.ForeignKeyConstraint(['friend_id'], ['user.id'], name='fk_friendships_friend_id_user'),
+        sa.PrimaryKeyConstraint('user_id', 'friend_id', name='pk_friendships'),
+        sa.CheckConstraint('user_id < friend_id', name='ck_friendships_ordered'),
+    )
+
+    # accept_request used to write both directions (and nothing stopped it writing them twice);
+    # fold every row onto its ordered pair and keep one
+    bind.execute(text("""
+        INSERT INTO friendships_new (user_id, friend_id)
+        SELECT DISTINCT
+            CASE WHEN user_id < friend_id THEN user_id ELSE friend_id END,
+            CASE WHEN user_id < friend_id THEN friend_id ELSE user_id END
+        FROM friendships
+        WHERE user_id IS NOT NULL AND friend_id IS NOT NULL AND user_id <> friend_id
+    """))
+
+    before = bind.execute(text('SELECT COUNT(*) FROM friendships')).scalar()
+    after = bind.execute(text('SELECT COUNT(*) FROM friendships_new')).scalar()
+    print(f"friendships: {before} rows -> {after} pairs")
+
+    op.drop_table('friendships')
+    op.rename_table('friendships_new', 'friendships')
+    op.create_index('ix_friendships_friend_id', 'friendships', ['friend_id', 'user_id'])
+
+
+def downgrade():
+    op.drop_index('ix_friendships_friend_id', table_name='friendships')
+
+    op.create_table(
+        'friendships_old',
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('friend_id', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+        sa.ForeignKeyConstraint(['friend_id'], ['user.id']),
+    )
+    op.execute("""
+        INSERT INTO friendships_old (user_id, friend_id)
+        SELECT user_id, friend_id FROM friendships
+        UNION ALL
+        SELECT friend_id, user_id FROM friendships
+    """)
+
+    op.drop_table('friendships')
+    op.rename_table('friendships_old', 'friendships')
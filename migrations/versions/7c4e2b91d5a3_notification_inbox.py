@@ -0,0 +1,60 @@
+"""notification inbox: kind/ref_id/actor_id, inbox index, backfill pending requests + invites
+
+Revision ID: 7c4e2b91d5a3
+Revises: 3f1a9c2d7b10
+Create Date: 2026-10-18 11:40:27.503118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import text
+
+
+# revision identifiers, used by Alembic.
+revision = '7c4e2b91d5a3'
+down_revision = '3f1a9c2d7b10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+
+    with op.batch_alter_table('notification') as batch_op:
+        batch_op.add_column(sa.Column('kind', sa.String(length=20), nullable=True))
+        batch_op.add_column(sa.Column('ref_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('actor_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_notification_actor_id_user', 'user', ['actor_id'], ['id'])
+
+    bind.execute(text("UPDATE notification SET is_read = :f WHERE is_read IS NULL"), {"f": False})
+    with op.batch_alter_table('notification') as batch_op:
+        batch_op.alter_column('is_read', existing_type=sa.Boolean(), nullable=False)
+
+    op.create_index('ix_notification_inbox', 'notification', ['user_id', 'is_read', 'created_at'])
+    op.create_index('ix_notification_ref', 'notification', ['kind', 'ref_id'])
+
+    # everything that's pending today becomes an unread inbox row
+    bind.execute(text("""
+        INSERT INTO notification (user_id, message, created_at, is_read, kind, ref_id, actor_id)
+        SELECT to_user_id, 'sent you a friend request', created_at, :f, 'friend_request', id, from_user_id
+        FROM friend_request
+        WHERE status = 'pending'
+    """), {"f": False})
+    bind.execute(text("""
+        INSERT INTO notification (user_id, message, created_at, is_read, kind, ref_id, actor_id)
+        SELECT to_user_id, 'invited you to a group', created_at, :f, 'group_invite', id, from_user_id
+        FROM group_invite
+        WHERE status = 'pending'
+    """), {"f": False})
+
+
+def downgrade():
+    op.execute("DELETE FROM notification WHERE kind IN ('friend_request', 'group_invite')")
+    op.drop_index('ix_notification_ref', table_name='notification')
+    op.drop_index('ix_notification_inbox', table_name='notification')
+    with op.batch_alter_table('notification') as batch_op:
+        batch_op.alter_column('is_read', existing_type=sa.Boolean(), nullable=True)
+        batch_op.drop_constraint('fk_notification_actor_id_user', type_='foreignkey')
+        batch_op.drop_column('actor_id')
+        batch_op.drop_column('ref_id')
+        batch_op.drop_column('kind')
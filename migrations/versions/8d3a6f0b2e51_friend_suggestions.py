@@ -0,0 +1,70 @@
+"""add friend_suggestion (precomputed mutual-friend / shared-group candidates), backfilled
+
+Revision ID: 8d3a6f0b2e51
+Revises: 5e2f8a1c4d97
+Create Date: 2026-10-18 16:20:57.640319
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d3a6f0b2e51'
+down_revision = '5e2f8a1c4d97'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'friend_suggestion',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('candidate_id', sa.Integer(), nullable=False),
+        sa.Column('mutual_friends', sa.Integer(), nullable=False),
+        sa.Column('shared_groups', sa.Integer(), nullable=False),
+        sa.Column('score', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+        sa.ForeignKeyConstraint(['candidate_id'], ['user.id']),
+        sa.PrimaryKeyConstraint('user_id', 'candidate_id'),
+    )
+    op.create_index(
+        'ix_friend_suggestion_rank',
+        'friend_suggestion',
+        ['user_id', sa.text('score DESC')],
+    )
+
+    # same query as `flask rebuild-suggestions` (a mutual friend scores 2, a shared group 1)
+    op.execute("""
+        WITH edges (a, b) AS (
+            SELECT user_id, friend_id FROM friendships
+            UNION ALL
+            SELECT friend_id, user_id FROM friendships
+        ),
+        raw (user_id, candidate_id, mutual_friends, shared_groups) AS (
+            SELECT e1.a, e2.b, COUNT(*), 0
+            FROM edges e1 JOIN edges e2 ON e2.a = e1.b
+            WHERE e2.b <> e1.a
+            GROUP BY e1.a, e2.b
+            UNION ALL
+            SELECT m1.user_id, m2.user_id, 0, COUNT(DISTINCT m1.group_id)
+            FROM group_member m1 JOIN group_member m2 ON m2.group_id = m1.group_id
+            WHERE m2.user_id <> m1.user_id
+            GROUP BY m1.user_id, m2.user_id
+        )
+        INSERT INTO friend_suggestion (user_id, candidate_id, mutual_friends, shared_groups, score)
+        SELECT r.user_id, r.candidate_id, SUM(r.mutual_friends), SUM(r.shared_groups),
+               2 * SUM(r.mutual_friends) + SUM(r.shared_groups)
+        FROM raw r
+        WHERE NOT EXISTS (
+            SELECT 1 FROM friendships f
+            WHERE f.user_id = CASE WHEN r.user_id < r.candidate_id THEN r.user_id ELSE r.candidate_id END
+              AND f.friend_id = CASE WHEN r.user_id < r.candidate_id THEN r.candidate_id ELSE r.user_id END
+        )
+        GROUP BY r.user_id, r.candidate_id
+    """)
+
+
+def downgrade():
+    op.drop_index('ix_friend_suggestion_rank', table_name='friend_suggestion')
+    op.drop_table('friend_suggestion')
@@ -0,0 +1,53 @@
+"""transaction.payer_id FK + (payer_id, id DESC) index, backfilled from payer full_name
+
+Revision ID: b81d3e5f0a27
+Revises: 7c4e2b91d5a3
+Create Date: 2026-10-18 12:25:51.904412
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import text
+
+
+# revision identifiers, used by Alembic.
+revision = 'b81d3e5f0a27'
+down_revision = '7c4e2b91d5a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+
+    with op.batch_alter_table('transaction') as batch_op:
+        batch_op.add_column(sa.Column('payer_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_transaction_payer_id_user', 'user', ['payer_id'], ['id'])
+
+    # payer used to be matched on full_name; only backfill names that belong to exactly one
+    # user, so rows for duplicated names stay unlinked instead of landing on the wrong account
+    bind.execute(text("""
+        UPDATE "transaction"
+        SET payer_id = (SELECT MIN(u.id) FROM "user" u WHERE u.full_name = "transaction".payer)
+        WHERE payer_id IS NULL
+          AND (SELECT COUNT(*) FROM "user" u WHERE u.full_name = "transaction".payer) = 1
+    """))
+
+    unlinked = bind.execute(text(
+        'SELECT COUNT(*) FROM "transaction" WHERE payer_id IS NULL AND payer IS NOT NULL'
+    )).scalar()
+    if unlinked:
+        print(f"transaction.payer_id: {unlinked} rows left unlinked (unknown or ambiguous payer name)")
+
+    op.create_index(
+        'ix_transaction_payer_id_id',
+        'transaction',
+        ['payer_id', sa.text('id DESC')],
+    )
+
+
+def downgrade():
+    op.drop_index('ix_transaction_payer_id_id', table_name='transaction')
+    with op.batch_alter_table('transaction') as batch_op:
+        batch_op.drop_constraint('fk_transaction_payer_id_user', type_='foreignkey')
+        batch_op.drop_column('payer_id')
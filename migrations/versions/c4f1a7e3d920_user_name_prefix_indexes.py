@@ -0,0 +1,30 @@
+"""user search: lower(full_name) / lower(username) indexes for the exact and prefix tiers
+
+Revision ID: c4f1a7e3d920
+Revises: 8d3a6f0b2e51
+Create Date: 2026-10-18 18:02:44.190263
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4f1a7e3d920'
+down_revision = '8d3a6f0b2e51'
+branch_labels = None
+depends_on = None
+
+
+# The app looks prefixes up as a range on lower(col) (q <= lower(col) < q's successor), which
+# a plain expression index serves in key order. On Postgres the key is compared in the "C"
+# collation so that range is exactly the set of strings starting with q.
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    collate = ' COLLATE "C"' if dialect == 'postgresql' else ''
+    op.execute(f'CREATE INDEX ix_user_full_name_lower ON "user" ((lower(full_name){collate}))')
+    op.execute(f'CREATE INDEX ix_user_username_lower ON "user" ((lower(username){collate}))')
+
+
+def downgrade():
+    op.execute('DROP INDEX IF EXISTS ix_user_username_lower')
+    op.execute('DROP INDEX IF EXISTS ix_user_full_name_lower')
@@ -0,0 +1,39 @@
+"""add user_totals (running paid_to_you / transaction_count per payer), backfilled
+
+Revision ID: d2a7f6c1e954
+Revises: b81d3e5f0a27
+Create Date: 2026-10-18 13:02:13.771954
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2a7f6c1e954'
+down_revision = 'b81d3e5f0a27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'user_totals',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('paid_to_you', sa.Float(), nullable=False),
+        sa.Column('transaction_count', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+        sa.PrimaryKeyConstraint('user_id'),
+    )
+
+    op.execute("""
+        INSERT INTO user_totals (user_id, paid_to_you, transaction_count)
+        SELECT payer_id, COALESCE(SUM(amount), 0), COUNT(id)
+        FROM "transaction"
+        WHERE payer_id IS NOT NULL
+        GROUP BY payer_id
+    """)
+
+
+def downgrade():
+    op.drop_table('user_totals')
@@ -0,0 +1,85 @@
+"""add transaction_item / transaction_item_owner, backfilled from transaction.description
+
+Revision ID: e5b19a3c7d42
+Revises: d2a7f6c1e954
+Create Date: 2026-10-18 13:47:39.208113
+
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import text
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b19a3c7d42'
+down_revision = 'd2a7f6c1e954'
+branch_labels = None
+depends_on = None
+
+
+# lines written by confirm_transaction: "Name ($1.23) split between: a, b"
+LINE_RE = re.compile(r"^(.*)\s+\(\$(\d+(?:\.\d+)?)\)\s+split between:\s*(.*)$")
+
+
+def upgrade():
+    item_table = op.create_table(
+        'transaction_item',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('transaction_id', sa.Integer(), nullable=False),
+        sa.Column('position', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=200), nullable=False),
+        sa.Column('price', sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(['transaction_id'], ['transaction.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_transaction_item_transaction_id', 'transaction_item', ['transaction_id'])
+    owner_table = op.create_table(
+        'transaction_item_owner',
+        sa.Column('item_id', sa.Integer(), nullable=False),
+        sa.Column('position', sa.Integer(), nullable=False),
+        sa.Column('owner', sa.String(length=120), nullable=False),
+        sa.ForeignKeyConstraint(['item_id'], ['transaction_item.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('item_id', 'position'),
+    )
+
+    # Backfill. The tables are new, so ids are handed out here and both tables go in as
+    # two bulk inserts.
+    bind = op.get_bind()
+    items, owners, skipped = [], [], 0
+    for txn_id, description in bind.execute(text(
+        'SELECT id, description FROM "transaction" WHERE description IS NOT NULL ORDER BY id'
+    )):
+        position = 0
+        for line in description.splitlines():
+            m = LINE_RE.match(line.strip())
+            if not m:
+                skipped += bool(line.strip())
+                continue
+            item_id = len(items) + 1
+            items.append({
+                'id': item_id,
+                'transaction_id': txn_id,
+                'position': position,
+                'name': m.group(1).strip()[:200],
+                'price': float(m.group(2)),
+            })
+            names = dict.fromkeys(o.strip() for o in m.group(3).split(",") if o.strip())
+            owners.extend({'item_id': item_id, 'position': i, 'owner': o[:120]} for i, o in enumerate(names))
+            position += 1
+
+    if items:
+        op.bulk_insert(item_table, items)
+    if owners:
+        op.bulk_insert(owner_table, owners)
+    if items and bind.dialect.name == 'postgresql':
+        op.execute("SELECT setval(pg_get_serial_sequence('transaction_item', 'id'), MAX(id)) FROM transaction_item")
+    if skipped:
+        print(f"transaction_item: {skipped} description lines didn't parse and were left as text only")
+
+
+def downgrade():
+    op.drop_table('transaction_item_owner')
+    op.drop_index('ix_transaction_item_transaction_id', table_name='transaction_item')
+    op.drop_table('transaction_item')
@@ -0,0 +1,26 @@
+"""transaction_item_owner.amount: each owner's cut of an item (weighted / fixed splits)
+
+Revision ID: f3c8d0a6b215
+Revises: e5b19a3c7d42
+Create Date: 2026-10-18 14:31:08.660742
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3c8d0a6b215'
+down_revision = 'e5b19a3c7d42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('transaction_item_owner') as batch_op:
+        batch_op.add_column(sa.Column('amount', sa.Float(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('transaction_item_owner') as batch_op:
+        batch_op.drop_column('amount')
@@ -6,16 +6,24 @@ from itsdangerous import URLSafeTimedSerializer
 db = SQLAlchemy()
 
 
+# One row per friendship, stored as (lower id, higher id). The PK serves lookups by user_id,
+# ix_friendships_friend_id the ones by friend_id; app.py has the helpers that query both.
 friendships = db.Table(
     'friendships',
-    db.Column('user_id', db.Integer, db.ForeignKey('user.id')),
-    db.Column('friend_id', db.Integer, db.ForeignKey('user.id'))
+    db.Column('user_id', db.Integer, db.ForeignKey('user.id', name='fk_friendships_user_id_user'), nullable=False),
+    db.Column('friend_id', db.Integer, db.ForeignKey('user.id', name='fk_friendships_friend_id_user'), nullable=False),
+    db.PrimaryKeyConstraint('user_id', 'friend_id', name='pk_friendships'),
+    db.CheckConstraint('user_id < friend_id', name='ck_friendships_ordered'),
+    db.Index('ix_friendships_friend_id', 'friend_id', 'user_id'),
 )
 
 
 
 
 class User(db.Model):
+    # Migration 1b7d4e9a2c60 keeps the user_search FTS5 table in sync with triggers on this
+    # table. On SQLite, batch_alter_table("user") recreates the table and silently drops them:
+    # a migration that does that must call create_sqlite_triggers() from 1b7d4e9a2c60 afterwards.
     id = db.Column(db.Integer, primary_key=True)
     full_name = db.Column(db.String(100))
     username = db.Column(db.String(80), unique=True, nullable=False)
@@ -29,14 +37,9 @@ class User(db.Model):
     reset_token = db.Column(db.String(100), nullable=True)
     reset_token_expires = db.Column(db.DateTime, nullable=True)
 
-    friends = db.relationship(
-        'User',
-        secondary=friendships,
-        primaryjoin=(friendships.c.user_id == id),
-        secondaryjoin=(friendships.c.friend_id == id),
-        backref=db.backref('friends_back', lazy='dynamic'),
-        lazy='dynamic'
-    )
+# user search's exact/prefix lookups (migration c4f1a7e3d920 adds COLLATE "C" on Postgres)
+db.Index('ix_user_full_name_lower', db.func.lower(User.full_name))
+db.Index('ix_user_username_lower', db.func.lower(User.username))
 
 class FriendRequest(db.Model):
     __tablename__ = 'friend_request'
@@ -53,11 +56,81 @@ class FriendRequest(db.Model):
 
 class Transaction(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    payer = db.Column(db.String(120))
+    payer = db.Column(db.String(120))       # display name at the time of the transaction
+    payer_id = db.Column(db.Integer, db.ForeignKey('user.id', name='fk_transaction_payer_id_user'), nullable=True)
+    group_id = db.Column(db.Integer, db.ForeignKey('group.id', name='fk_transaction_group_id_group'), nullable=True, index=True)
     amount = db.Column(db.Float)
     date = db.Column(db.String(100))  
     description = db.Column(db.Text)
 
+    items = db.relationship('TransactionItem', backref='transaction', cascade='all, delete-orphan',
+                            order_by='TransactionItem.position')
+
+# a user's transactions, newest first
+db.Index('ix_transaction_payer_id_id', Transaction.payer_id, Transaction.id.desc())
+
+class TransactionItem(db.Model):
+    __tablename__ = 'transaction_item'
+    id             = db.Column(db.Integer, primary_key=True)
+    transaction_id = db.Column(db.Integer, db.ForeignKey('transaction.id', ondelete='CASCADE'), nullable=False, index=True)
+    position       = db.Column(db.Integer, nullable=False, default=0)    # order on the receipt
+    name           = db.Column(db.String(200), nullable=False)
+    price          = db.Column(db.Float, nullable=False, default=0.0)
+
+    owners = db.relationship('TransactionItemOwner', cascade='all, delete-orphan',
+                             order_by='TransactionItemOwner.position')
+
+class TransactionItemOwner(db.Model):
+    __tablename__ = 'transaction_item_owner'
+    item_id  = db.Column(db.Integer, db.ForeignKey('transaction_item.id', ondelete='CASCADE'), primary_key=True)
+    position = db.Column(db.Integer, primary_key=True)
+    owner    = db.Column(db.String(120), nullable=False)    # email or name, as picked in the split form
+    amount   = db.Column(db.Float, nullable=True)           # this owner's cut of the item
+
+class UserTotals(db.Model):
+    """
+    Running per-user aggregates over Transaction (payer_id), kept in step by the routes that
+    insert/delete transactions. `flask reconcile-totals` rebuilds them from scratch.
+    """
+    __tablename__ = 'user_totals'
+    user_id           = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    paid_to_you       = db.Column(db.Float, nullable=False, default=0.0)
+    transaction_count = db.Column(db.Integer, nullable=False, default=0)
+
+class GroupBalance(db.Model):
+    """
+    Running net balance per group member, in cents: positive = the group owes them,
+    negative = they owe the group. Sum of ledger entries, maintained incrementally.
+    """
+    __tablename__ = 'group_balance'
+    group_id      = db.Column(db.Integer, db.ForeignKey('group.id', ondelete='CASCADE'), primary_key=True)
+    user_id       = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    balance_cents = db.Column(db.BigInteger, nullable=False, default=0)
+
+class GroupLedgerEntry(db.Model):
+    """One balance change caused by a group transaction; reversed when the transaction is deleted."""
+    __tablename__ = 'group_ledger_entry'
+    id             = db.Column(db.Integer, primary_key=True)
+    transaction_id = db.Column(db.Integer, db.ForeignKey('transaction.id', ondelete='CASCADE'), nullable=False, index=True)
+    group_id       = db.Column(db.Integer, db.ForeignKey('group.id', ondelete='CASCADE'), nullable=False)
+    user_id        = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    delta_cents    = db.Column(db.BigInteger, nullable=False)
+
+class FriendSuggestion(db.Model):
+    """
+    Precomputed "people you may know": candidate isn't user's friend yet but shares friends
+    and/or groups with them. `flask rebuild-suggestions` builds the table; new friendships and
+    group joins/leaves adjust it incrementally. Stored for both directions of every pair.
+    """
+    __tablename__ = 'friend_suggestion'
+    user_id        = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    candidate_id   = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    mutual_friends = db.Column(db.Integer, nullable=False, default=0)
+    shared_groups  = db.Column(db.Integer, nullable=False, default=0)
+    score          = db.Column(db.Integer, nullable=False, default=0)
+
+db.Index('ix_friend_suggestion_rank', FriendSuggestion.user_id, FriendSuggestion.score.desc())
+
 class Group(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100))
@@ -85,12 +158,36 @@ class GroupInvite(db.Model):
 
 class Notification(db.Model):
     """
-    Stores notifications for users.
+    Stores notifications for users. `kind` + `ref_id` point at the row that caused it
+    (friend_request / group_invite id); `actor_id` is the user who triggered it.
     """
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
     message = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
-    is_read = db.Column(db.Boolean, default=False)
+    is_read = db.Column(db.Boolean, default=False, nullable=False)
+    kind = db.Column(db.String(20), nullable=True)
+    ref_id = db.Column(db.Integer, nullable=True)
+    actor_id = db.Column(db.Integer, db.ForeignKey("user.id", name="fk_notification_actor_id_user"), nullable=True)
+
+    user = db.relationship("User", foreign_keys=[user_id], backref="notifications")
+    actor = db.relationship("User", foreign_keys=[actor_id])
 
-    user = db.relationship("User", backref="notifications")
+    __table_args__ = (
+        db.Index('ix_notification_inbox', 'user_id', 'is_read', 'created_at'),
+        db.Index('ix_notification_ref', 'kind', 'ref_id'),
+    )
+
+class ReceiptScanJob(db.Model):
+    """
+    A queued receipt scan. Lives in the DB so any web worker can answer the status poll.
+    """
+    __tablename__ = 'receipt_scan_job'
+    id          = db.Column(db.String(32), primary_key=True)
+    user_id     = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    group_id    = db.Column(db.Integer, nullable=True)
+    status      = db.Column(db.String(20), nullable=False, default='queued')   # queued | running | done | failed
+    result      = db.Column(db.Text, nullable=True)    # JSON item list once done
+    error       = db.Column(db.Text, nullable=True)
+    created_at  = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
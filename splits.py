@@ -0,0 +1,292 @@
+"""
+Bill splitting in integer cents.
+
+Every price is converted to cents once and all items of all bills in a request are
+allocated together with NumPy. Each item picks how it's divided with "split":
+
+    equal    (default) evenly between "owners"
+    shares   by "weights" aligned with owners, e.g. [2, 1, 1] for the couple + two singles
+    percent  by "weights" that are percentages adding up to 100
+    fixed    "amounts" aligned with owners; owners whose amount is null split the rest evenly
+
+Cents that don't divide evenly go one at a time to the owners with the largest fractional
+share (ties: earlier owner first), so an item's shares always add up to its price exactly.
+A $10.00 item split three ways is 334 / 333 / 333.
+
+split_bills() returns what /calculate has always returned: for each bill a
+{person: amount} dict where owners are positive (what they owe the payer) and the payer
+is negative (what they're owed). settle_up() turns a group's net balances into a short
+list of transfers.
+"""
+import heapq
+
+import numpy as np
+
+SPLIT_MODES = ("equal", "shares", "percent", "fixed")
+_MODE_CODES = {mode: code for code, mode in enumerate(SPLIT_MODES)}
+
+# fractional weights / percentages are compared as integers at this precision
+WEIGHT_SCALE = 10_000
+
+# Bounds that keep the int64 math exact: prices and fixed amounts up to $1 billion (1e11
+# cents), weights up to 1e9 (1e13 once scaled). pool * weight can still pass 2**63, so
+# _weighted_shares falls back to Python ints for that product when it would.
+MAX_PRICE = 1_000_000_000
+MAX_WEIGHT = 1_000_000_000
+_INT64_MAX = np.iinfo(np.int64).max
+
+
+class SplitError(ValueError):
+    """A bill that can't be split (bad price, missing payer, inconsistent weights)."""
+
+
+def to_cents(prices) -> np.ndarray:
+    """Dollar amounts (numbers or numeric strings) -> int64 cents, rounded to the nearest cent."""
+    try:
+        dollars = np.asarray(prices, dtype=np.float64)
+    except (TypeError, ValueError):
+        raise SplitError("Invalid price")
+    if not np.all(np.isfinite(dollars)):
+        raise SplitError("Invalid price")
+    if np.any(np.abs(dollars) > MAX_PRICE):
+        raise SplitError(f"Prices can't be more than {MAX_PRICE:,}")
+    return np.rint(dollars * 100).astype(np.int64)
+
+
+def _numbers(values, what: str) -> np.ndarray:
+    try:
+        out = np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        raise SplitError(f"Invalid {what}")
+    return out
+
+
+def _label(bills: list[dict], b: int, i: int) -> str:
+    return f"Item {i + 1}" if len(bills) == 1 else f"Bill {b + 1}, item {i + 1}"
+
+
+def _allocate(bills: list[dict]):
+    """
+    Flattens every (item, owner) pair of every bill into rows and allocates each item's cents
+    across its rows. Returns (people, row_person, row_payer, row_item, row_valid, share, n_items)
+    where `people` is a list of (bill index, person) indexed by the ids in row_person/row_payer
+    and `share` is int64 cents per row.
+    """
+    prices, item_bill, item_size = [], [], []
+    row_person: list[int] = []
+    people: dict[tuple, int] = {}
+    payers: list[int] = []
+    custom = []          # (item, first row, mode, values, is_fixed, (bill, item position)) for non-equal items
+    number = people.setdefault
+
+    for b, bill in enumerate(bills):
+        paid_by = bill.get("paid_by")
+        if not paid_by:
+            raise SplitError("Missing paid_by")
+        payers.append(number((b, paid_by), len(people)))
+
+        for i, item in enumerate(bill.get("items") or []):
+            owners = item.get("owners")
+            if not owners:
+                continue
+            mode = item.get("split")
+            if mode and mode != "equal":
+                n, rows = len(owners), len(row_person)
+                if mode in ("shares", "percent"):
+                    weights = item.get("weights")
+                    if not isinstance(weights, list) or len(weights) != n:
+                        raise SplitError(f"{_label(bills, b, i)}: weights must list one value per owner")
+                    custom.append((len(prices), rows, mode, weights, None, (b, i)))
+                elif mode == "fixed":
+                    amounts = item.get("amounts")
+                    if not isinstance(amounts, list) or len(amounts) != n:
+                        raise SplitError(f"{_label(bills, b, i)}: amounts must list one value (or null) per owner")
+                    custom.append((len(prices), rows, mode, [np.nan if a is None else a for a in amounts],
+                                   [a is not None for a in amounts], (b, i)))
+                else:
+                    raise SplitError(f"{_label(bills, b, i)}: unknown split mode {mode!r}")
+
+            prices.append(item.get("price", 0))
+            item_bill.append(b)
+            item_size.append(len(owners))
+            row_person.extend([number((b, o), len(people)) for o in owners])
+
+    n_items = len(prices)
+    if not n_items:
+        empty = np.zeros(0, dtype=np.int64)
+        return list(people), empty, empty, empty, empty.astype(bool), empty, 0
+
+    item_cents = to_cents(prices)
+    item_size = np.asarray(item_size, dtype=np.int64)
+    row_item = np.repeat(np.arange(n_items), item_size)
+    row_person = np.asarray(row_person, dtype=np.int64)
+    row_payer = np.asarray(payers, dtype=np.int64)[np.asarray(item_bill, dtype=np.int64)][row_item]
+    row_valid = (item_cents > 0)[row_item]
+
+    # Equal splits (the common case): even share per owner, plus one cent for the first
+    # (cents % owners) owners of each item.
+    base, leftover = np.divmod(item_cents, item_size)
+    item_start = np.cumsum(item_size) - item_size
+    rank = np.arange(len(row_item)) - item_start[row_item]
+    share = base[row_item] + (rank < leftover[row_item])
+
+    if custom:
+        custom_rows, custom_share = _weighted_shares(bills, custom, item_cents)
+        share[custom_rows] = custom_share
+
+    return list(people), row_person, row_payer, row_item, row_valid, share, n_items
+
+
+def _sum_by(groups: np.ndarray, values: np.ndarray, n: int) -> np.ndarray:
+    """Per-group int64 sums (np.bincount sums in float64, which stops being exact at 2**53)."""
+    out = np.zeros(n, dtype=np.int64)
+    np.add.at(out, groups, values.astype(np.int64))
+    return out
+
+
+def _weighted_shares(bills: list[dict], custom: list, item_cents: np.ndarray):
+    """
+    Largest-remainder allocation for the shares / percent / fixed items only. Returns the
+    global row indices of those items' rows and their cents.
+    """
+    sizes = np.asarray([len(values) for _, _, _, values, _, _ in custom], dtype=np.int64)
+    n = len(custom)
+    local_item = np.repeat(np.arange(n), sizes)
+    starts = np.asarray([start for _, start, _, _, _, _ in custom], dtype=np.int64)
+    local_start = np.cumsum(sizes) - sizes
+    global_rows = starts[local_item] + (np.arange(len(local_item)) - local_start[local_item])
+
+    row_raw = _numbers([v for _, _, _, values, _, _ in custom for v in values], "weights or amounts")
+    row_is_fixed = np.asarray([bool(f) for _, _, _, values, is_fixed, _ in custom
+                               for f in (is_fixed or [False] * len(values))], dtype=bool)
+    cents = item_cents[[item for item, _, _, _, _, _ in custom]]
+    mode = np.asarray([_MODE_CODES[m] for _, _, m, _, _, _ in custom], dtype=np.int64)
+    valid = cents > 0
+
+    def fail(item_mask, message):
+        if np.any(item_mask):
+            raise SplitError(f"{_label(bills, *custom[int(np.argmax(item_mask))][5])}: {message}")
+
+    # Fixed rows take their amount off the top and have weight 0; the rows of a fixed item
+    # without an amount share what's left evenly.
+    fixed = mode == _MODE_CODES["fixed"]
+    row_fixed_mode = fixed[local_item]
+    row_bad = ~(np.isfinite(row_raw) & (row_raw >= 0))
+    fail(np.bincount(local_item, weights=~row_fixed_mode & row_bad, minlength=n) > 0,
+         "weights must be non-negative numbers")
+    fail(np.bincount(local_item, weights=row_is_fixed & row_bad, minlength=n) > 0,
+         "amounts must be non-negative numbers")
+    fail(np.bincount(local_item, weights=~row_fixed_mode & ~row_bad & (row_raw > MAX_WEIGHT), minlength=n) > 0,
+         f"weights can't be more than {MAX_WEIGHT:,}")
+    fail(np.bincount(local_item, weights=row_is_fixed & ~row_bad & (row_raw > MAX_PRICE), minlength=n) > 0,
+         f"amounts can't be more than {MAX_PRICE:,}")
+
+    row_fixed = np.where(row_is_fixed, to_cents(np.where(row_is_fixed, row_raw, 0)), 0)
+    row_weight = np.where(
+        row_fixed_mode,
+        (~row_is_fixed).astype(np.int64),
+        np.rint(np.where(row_fixed_mode, 0, row_raw) * WEIGHT_SCALE).astype(np.int64),
+    )
+
+    total_weight = _sum_by(local_item, row_weight, n)
+    pool = cents - _sum_by(local_item, row_fixed, n)
+
+    fail(valid & (mode == _MODE_CODES["percent"])
+         & (np.abs(total_weight - 100 * WEIGHT_SCALE) > WEIGHT_SCALE // 100),
+         "percentages must add up to 100")
+    fail(valid & (pool < 0), "fixed amounts add up to more than the price")
+    fail(valid & fixed & (pool > 0) & (total_weight == 0), "fixed amounts don't add up to the price")
+    fail(valid & ~fixed & (total_weight == 0), "weights are all zero")
+
+    # Largest-remainder allocation of each item's pool by weight.
+    safe_total = np.maximum(total_weight, 1)[local_item]
+    row_pool = np.maximum(pool, 0)[local_item]
+    if int(row_pool.max(initial=0)) * int(row_weight.max(initial=0)) <= _INT64_MAX:
+        floor, frac = np.divmod(row_pool * row_weight, safe_total)
+    else:
+        # exact in Python ints; floor <= pool and frac < total weight both fit back in int64
+        product, total = row_pool.astype(object) * row_weight.astype(object), safe_total.astype(object)
+        floor, frac = (product // total).astype(np.int64), (product % total).astype(np.int64)
+    leftover = pool - _sum_by(local_item, floor, n)
+
+    order = np.lexsort((np.arange(len(local_item)), -frac, local_item))   # by item, biggest remainder first
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order)) - local_start[local_item[order]]
+    return global_rows, row_fixed + floor + (rank < leftover[local_item])
+
+
+def split_bills(bills: list[dict]) -> list[dict[str, float]]:
+    """
+    bills: [{"paid_by": person, "items": [{"price": 1.23, "owners": [person, ...], ...}, ...]}, ...]
+    Returns one reimbursements dict per bill, in the same order. Items with no owners or
+    a non-positive price are skipped, as before.
+    """
+    people, row_person, row_payer, _, row_valid, share, n_items = _allocate(bills)
+    results: list[dict[str, float]] = [{} for _ in bills]
+    if not n_items:
+        return results
+
+    # The payer's own shares cancel out; everyone else owes theirs to the payer.
+    owed = np.where(row_valid & (row_person != row_payer), share, 0)
+    balance = (np.bincount(row_person, weights=owed, minlength=len(people))
+               - np.bincount(row_payer, weights=owed, minlength=len(people))).astype(np.int64)
+
+    # Everyone who owns a split item gets an entry, and so does the payer of any bill with at
+    # least one (even when they're its only owner).
+    listed = np.zeros(len(people), dtype=bool)
+    listed[row_person[row_valid]] = True
+    listed[row_payer[row_valid]] = True
+    for idx in np.flatnonzero(listed).tolist():
+        b, person = people[idx]
+        results[b][person] = round(int(balance[idx]) / 100, 2)
+    return results
+
+
+def split_bill(paid_by: str, items: list[dict]) -> dict[str, float]:
+    return split_bills([{"paid_by": paid_by, "items": items}])[0]
+
+
+def item_shares(items: list[dict]) -> list[list[float]]:
+    """
+    Per-owner share in dollars for each item, aligned with item["owners"]. Items that are
+    skipped by the split (no owners, non-positive price) get zeros.
+    """
+    _, _, _, row_item, row_valid, share, n_items = _allocate([{"paid_by": "-", "items": items}])
+    out: list[list[float]] = [[0.0] * len(item.get("owners") or []) for item in items]
+    if not n_items:
+        return out
+
+    cents = np.where(row_valid, share, 0).tolist()
+    row = 0
+    for k, item in enumerate(items):
+        n = len(item.get("owners") or [])
+        if n:
+            out[k] = [c / 100 for c in cents[row:row + n]]
+            row += n
+    return out
+
+
+def settle_up(balances: dict) -> list[tuple]:
+    """
+    Transfers that zero out a set of net balances (cents; positive = owed money).
+    Greedy minimal cash flow: the biggest debtor pays the biggest creditor, until someone
+    is square. Each transfer settles at least one person, so there are at most n - 1 of
+    them, and with two heaps it runs in O(n log n).
+    Returns [(from, to, cents), ...].
+    """
+    creditors = [(-cents, key) for key, cents in balances.items() if cents > 0]
+    debtors = [(cents, key) for key, cents in balances.items() if cents < 0]
+    heapq.heapify(creditors)
+    heapq.heapify(debtors)
+
+    transfers = []
+    while creditors and debtors:
+        owed, creditor = heapq.heappop(creditors)
+        owes, debtor = heapq.heappop(debtors)
+        amount = min(-owed, -owes)
+        transfers.append((debtor, creditor, amount))
+        if -owed > amount:
+            heapq.heappush(creditors, (owed + amount, creditor))
+        if -owes > amount:
+            heapq.heappush(debtors, (owes + amount, debtor))
+    return transfers
@@ -0,0 +1,49 @@
+// "Load more" / infinite scroll for history lists.
+// A .load-more button fetches `${data-url}&before=${data-cursor}`, appends the returned
+// rows to #data-target and takes the next cursor from X-Next-Cursor (none = last page).
+(() => {
+  let io = null;
+
+  async function loadMore(btn) {
+    if (btn.dataset.loading) return;
+    btn.dataset.loading = "1";
+    const label = btn.textContent;
+    btn.textContent = "Loading…";
+
+    try {
+      const sep = btn.dataset.url.includes("?") ? "&" : "?";
+      const r = await fetch(`${btn.dataset.url}${sep}before=${encodeURIComponent(btn.dataset.cursor)}`);
+      if (!r.ok) throw 0;
+
+      const target = document.getElementById(btn.dataset.target);
+      target?.insertAdjacentHTML("beforeend", await r.text());
+      document.dispatchEvent(new CustomEvent("rows-loaded", { detail: target }));
+
+      const next = r.headers.get("X-Next-Cursor");
+      if (!next) return btn.remove();
+      btn.dataset.cursor = next;
+      btn.textContent = label;
+      // re-observe so a button that is still on screen fires again
+      if (io) { io.unobserve(btn); io.observe(btn); }
+    } catch {
+      btn.textContent = "Couldn’t load more. Retry";
+      io?.unobserve(btn);   // no retry loop; a click still works
+    } finally {
+      delete btn.dataset.loading;
+    }
+  }
+
+  document.addEventListener("click", (e) => {
+    const btn = e.target.closest(".load-more");
+    if (btn) loadMore(btn);
+  });
+
+  // infinite scroll: fetch the next page as the button comes into view
+  document.addEventListener("DOMContentLoaded", () => {
+    if (!("IntersectionObserver" in window)) return;
+    io = new IntersectionObserver((entries) => {
+      entries.forEach((en) => en.isIntersecting && loadMore(en.target));
+    }, { rootMargin: "200px" });
+    document.querySelectorAll(".load-more").forEach((b) => io.observe(b));
+  });
+})();
@@ -18,6 +18,7 @@ document.addEventListener("DOMContentLoaded", () => {
   const manualItemsList = document.getElementById("manual-items-list");
   const userEmail = document.getElementById("user-email")?.value || "";
   const userFullName = document.getElementById("user-full-name")?.value || "";
+  const receiptStreaming = document.getElementById("receipt-streaming")?.value === "true";
 
   // ---- Manual entry running total ----
   const manualItems = [];
@@ -112,6 +113,7 @@ document.addEventListener("DOMContentLoaded", () => {
         const emailToName = { [userEmail]: userFullName };
         manualItems.forEach((item) => item.owners.forEach((o) => (emailToName[o.email] = o.name)));
         renderResults(data.reimbursements, userEmail, userFullName, emailToName);
+        offerSave(payload, groupSelect?.value);
       }
     } catch (err) {
       console.error("Manual calc error:", err);
@@ -120,6 +122,82 @@ document.addEventListener("DOMContentLoaded", () => {
   });
 
   // ---- Receipt upload flow ----
+  const sleep = (ms) => new Promise((r) => setTimeout(r, ms));
+
+  // Async scans come back as a job id; poll until the worker pool finishes it. A scan takes
+  // seconds, so give up after SCAN_JOB_TIMEOUT_MS (the server fails jobs stuck for 10 min).
+  const SCAN_JOB_TIMEOUT_MS = 3 * 60 * 1000;
+
+  async function waitForScanJob(statusUrl) {
+    const deadline = Date.now() + SCAN_JOB_TIMEOUT_MS;
+    let delay = 750;
+    for (;;) {
+      if (Date.now() + delay > deadline) {
+        throw new Error("The receipt scan is taking too long. Please try again.");
+      }
+      await sleep(delay);
+      const res = await fetch(statusUrl);
+      const data = await res.json();
+      if (data.error) throw new Error(data.error);
+      if (data.status === "done") return data;
+      delay = Math.min(delay * 1.5, 3000);
+    }
+  }
+
+  // Reads a text/event-stream body and calls onEvent(name, data) for each frame
+  async function readEventStream(res, onEvent) {
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buf = "";
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buf += decoder.decode(value, { stream: true });
+      let sep;
+      while ((sep = buf.indexOf("\n\n")) !== -1) {
+        const frame = buf.slice(0, sep);
+        buf = buf.slice(sep + 2);
+        let event = "message";
+        let data = "";
+        frame.split("\n").forEach((line) => {
+          if (line.startsWith("event:")) event = line.slice(6).trim();
+          else if (line.startsWith("data:")) data += line.slice(5).trim();
+        });
+        if (data) onEvent(event, JSON.parse(data));
+      }
+    }
+  }
+
+  // Streaming scan: items show up in the split table as the model emits them
+  async function streamReceipt(formData) {
+    const res = await fetch("/upload_receipt/stream", { method: "POST", body: formData });
+    if (!res.ok || !(res.headers.get("Content-Type") || "").includes("text/event-stream")) {
+      const data = await res.json().catch(() => ({}));
+      throw new Error(data.error || `Upload failed (${res.status})`);
+    }
+
+    let people = [];
+    let scannedSoFar = 0;
+    let finished = false;
+    await readEventStream(res, (event, data) => {
+      if (event === "meta") {
+        people = [data.user, ...data.friends];
+        startReceipt(people);
+        resultsDiv.innerHTML = `<p class="text-sm text-gray-500 pt-4">Reading receipt…</p>`;
+      } else if (event === "item") {
+        addReceiptItem(data, people);
+        scannedSoFar += Number(data.price) || 0;
+        resultsDiv.innerHTML = `<p class="text-sm text-gray-500 text-right pt-4">Reading receipt… $${scannedSoFar.toFixed(2)} so far</p>`;
+      } else if (event === "done") {
+        finishReceipt(data.total_amount);
+        finished = true;
+      } else if (event === "error") {
+        throw new Error(data.error);
+      }
+    });
+    if (!finished) throw new Error("Receipt scan was interrupted.");
+  }
+
   uploadForm?.addEventListener("submit", async (e) => {
     e.preventDefault();
     const file = document.getElementById("receipt-upload").files[0];
@@ -131,103 +209,127 @@ document.addEventListener("DOMContentLoaded", () => {
     if (groupId) formData.append("group_id", groupId);
 
     try {
+      // Streaming is opt-in per deployment (RECEIPT_STREAM_UPLOADS, threaded workers only)
+      if (receiptStreaming && window.ReadableStream && window.TextDecoder) {
+        await streamReceipt(formData);
+        return;
+      }
+
+      // Default: a queued scan, so the web worker is free while OpenAI reads the receipt
+      formData.append("mode", "async");
       const res = await fetch("/upload_receipt", { method: "POST", body: formData });
-      const data = await res.json();
+      let data = await res.json();
       if (data.error) throw new Error(data.error);
 
-      const { items, user, friends, total_amount } = data;
-      receiptItemEntry.classList.remove("hidden");
-      receiptItemsList.innerHTML = "";
-      resultsDiv.innerHTML = `<p class="font-bold text-right pt-4">Total: $${Number(total_amount).toFixed(2)}</p>`;
-
-      // Payor dropdown
-      paidBySelect.innerHTML = "";
-      const emailToName = {};
-      emailToName[user.email] = user.full_name;
-      friends.forEach((f) => (emailToName[f.email] = f.full_name));
-      [user, ...friends].forEach((person) => {
-        const opt = document.createElement("option");
-        opt.value = person.email;
-        opt.textContent = person.full_name;
-        paidBySelect.appendChild(opt);
-      });
+      if (data.job_id) {
+        resultsDiv.innerHTML = `<p class="text-sm text-gray-500 pt-4">Scanning receipt…</p>`;
+        data = await waitForScanJob(data.status_url);
+      }
+      renderReceipt(data);
+    } catch (err) {
+      console.error("Upload error:", err);
+      resultsDiv.innerHTML = `<p class="text-red-600 font-semibold">Error uploading receipt: ${err.message || ""}</p>`;
+    }
+  });
 
-      // Per-item owner multiselects
-      items.forEach((item) => {
-        const itemLi = document.createElement("li");
-        itemLi.className = "border rounded p-3";
-        itemLi.innerHTML = `<p class="font-semibold">${item.name} - $${Number(item.price).toFixed(2)}</p>`;
-        const select = document.createElement("select");
-        select.multiple = true;
-        select.className = "mt-2 border rounded w-full p-2";
-        [user, ...friends].forEach((person) => {
-          const opt = document.createElement("option");
-          opt.value = person.email;
-          opt.textContent = person.full_name;
-          select.appendChild(opt);
-        });
-        itemLi.appendChild(select);
-        receiptItemsList.appendChild(itemLi);
-      });
+  function renderReceipt(data) {
+    const { items, user, friends, total_amount } = data;
+    const people = [user, ...friends];
+    startReceipt(people);
+    items.forEach((item) => addReceiptItem(item, people));
+    finishReceipt(total_amount);
+  }
 
-      // Split button behavior
-      splitItemsBtn.onclick = async () => {
-        const builtItems = [];
-        receiptItemsList.querySelectorAll("li").forEach((li) => {
-          const label = li.querySelector("p")?.innerText || "";
-          const match = label.match(/^(.*?) - \$(\d+(\.\d{2})?)/);
-          if (!match) return;
-
-          const name = match[1].trim();
-          const price = parseFloat(match[2]);
-          const select = li.querySelector("select");
-          const owners = Array.from(select.selectedOptions).map((o) => ({
-            email: o.value,
-            name: o.textContent,
-          }));
-
-          if (owners.length > 0) builtItems.push({ name, price, owners });
-        });
+  function finishReceipt(totalAmount) {
+    resultsDiv.innerHTML = `<p class="font-bold text-right pt-4">Total: $${Number(totalAmount).toFixed(2)}</p>`;
+  }
 
-        if (builtItems.length === 0) return alert("Please assign at least one owner to each item.");
+  // Per-item owner multiselect
+  function addReceiptItem(item, people) {
+    const itemLi = document.createElement("li");
+    itemLi.className = "border rounded p-3";
+    itemLi.innerHTML = `<p class="font-semibold">${item.name} - $${Number(item.price).toFixed(2)}</p>`;
+    const select = document.createElement("select");
+    select.multiple = true;
+    select.className = "mt-2 border rounded w-full p-2";
+    people.forEach((person) => {
+      const opt = document.createElement("option");
+      opt.value = person.email;
+      opt.textContent = person.full_name;
+      select.appendChild(opt);
+    });
+    itemLi.appendChild(select);
+    receiptItemsList.appendChild(itemLi);
+  }
+
+  function startReceipt(people) {
+    receiptItemEntry.classList.remove("hidden");
+    receiptItemsList.innerHTML = "";
+
+    // Payor dropdown
+    paidBySelect.innerHTML = "";
+    people.forEach((person) => {
+      const opt = document.createElement("option");
+      opt.value = person.email;
+      opt.textContent = person.full_name;
+      paidBySelect.appendChild(opt);
+    });
 
-        const paidBy = paidBySelect.value;
+    // Split button behavior
+    splitItemsBtn.onclick = async () => {
+      const builtItems = [];
+      receiptItemsList.querySelectorAll("li").forEach((li) => {
+        const label = li.querySelector("p")?.innerText || "";
+        const match = label.match(/^(.*?) - \$(\d+(\.\d{2})?)/);
+        if (!match) return;
+
+        const name = match[1].trim();
+        const price = parseFloat(match[2]);
+        const select = li.querySelector("select");
+        const owners = Array.from(select.selectedOptions).map((o) => ({
+          email: o.value,
+          name: o.textContent,
+        }));
+
+        if (owners.length > 0) builtItems.push({ name, price, owners });
+      });
 
-        // Name lookup for pretty output
-        const nameLookup = {};
-        document.querySelectorAll("#receipt-paid-by option").forEach((opt) => (nameLookup[opt.value] = opt.textContent));
+      if (builtItems.length === 0) return alert("Please assign at least one owner to each item.");
 
-        const payload = {
-          paid_by: paidBy,
-          items: builtItems.map((item) => ({
-            name: item.name,
-            price: item.price,
-            owners: item.owners.map((o) => o.email),
-          })),
-        };
+      const paidBy = paidBySelect.value;
 
-        try {
-          const res = await fetch("/calculate", {
-            method: "POST",
-            headers: { "Content-Type": "application/json" },
-            body: JSON.stringify(payload),
-          });
-          const data = await res.json();
-          if (data.error) {
-            resultsDiv.innerHTML = `<p class="text-red-600 font-semibold">Error: ${data.error}</p>`;
-          } else {
-            renderResults(data.reimbursements, paidBy, nameLookup[paidBy] || paidBy, nameLookup);
-          }
-        } catch (err) {
-          console.error("Split calc error:", err);
-          resultsDiv.innerHTML = `<p class="text-red-600 font-semibold">Something went wrong.</p>`;
-        }
+      // Name lookup for pretty output
+      const nameLookup = {};
+      document.querySelectorAll("#receipt-paid-by option").forEach((opt) => (nameLookup[opt.value] = opt.textContent));
+
+      const payload = {
+        paid_by: paidBy,
+        items: builtItems.map((item) => ({
+          name: item.name,
+          price: item.price,
+          owners: item.owners.map((o) => o.email),
+        })),
       };
-    } catch (err) {
-      console.error("Upload error:", err);
-      resultsDiv.innerHTML = `<p class="text-red-600 font-semibold">Error uploading receipt: ${err.message || ""}</p>`;
-    }
-  });
+
+      try {
+        const res = await fetch("/calculate", {
+          method: "POST",
+          headers: { "Content-Type": "application/json" },
+          body: JSON.stringify(payload),
+        });
+        const data = await res.json();
+        if (data.error) {
+          resultsDiv.innerHTML = `<p class="text-red-600 font-semibold">Error: ${data.error}</p>`;
+        } else {
+          renderResults(data.reimbursements, paidBy, nameLookup[paidBy] || paidBy, nameLookup);
+          offerSave(payload, uploadGroupSelect?.value);
+        }
+      } catch (err) {
+        console.error("Split calc error:", err);
+        resultsDiv.innerHTML = `<p class="text-red-600 font-semibold">Something went wrong.</p>`;
+      }
+    };
+  }
 
   itemPriceInput?.addEventListener("input", updateRunningTotal);
 
@@ -262,6 +364,41 @@ document.addEventListener("DOMContentLoaded", () => {
     `;
   }
 
+  // /calculate is only a preview; the split is saved when the user confirms it.
+  // Only bills you paid are saved (they record what the others owe you).
+  function offerSave(payload, groupId) {
+    if (!userEmail || payload.paid_by !== userEmail) return;
+    const btn = document.createElement("button");
+    btn.type = "button";
+    btn.className = "mt-4 px-4 py-2 bg-[#019863] text-white rounded-lg text-sm font-bold hover:bg-[#017f53] transition";
+    btn.textContent = "Save transaction";
+    const status = document.createElement("p");
+    status.className = "mt-2 text-sm";
+
+    btn.addEventListener("click", async () => {
+      btn.disabled = true;
+      try {
+        const res = await fetch("/confirm_transaction", {
+          method: "POST",
+          headers: { "Content-Type": "application/json" },
+          body: JSON.stringify({ ...payload, group_id: groupId || null }),
+        });
+        const data = await res.json();
+        if (!res.ok || data.error) throw new Error(data.error || "Couldn’t save the transaction.");
+        btn.remove();
+        status.className = "mt-2 text-sm text-green-600 font-semibold";
+        status.textContent = "Saved to your transactions.";
+      } catch (err) {
+        console.error("Confirm error:", err);
+        btn.disabled = false;
+        status.className = "mt-2 text-sm text-red-600";
+        status.textContent = err.message || "Couldn’t save the transaction.";
+      }
+    });
+
+    resultsDiv.append(btn, status);
+  }
+
   function resetOwnersDropdown() {
     ownerSelect.innerHTML = "";
     const userOption = document.createElement("option");
@@ -348,7 +485,7 @@ document.addEventListener("DOMContentLoaded", () => {
         <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M6 18L18 6M6 6l12 12"/>
       </svg>`;
 
-    const defaultPic = "/static/profile_pics/default.png";
+    const defaultPic = "/static/profile_pics/default.jpg";
     const avatar = (src) =>
       `<img src="${src && src.trim() ? src : defaultPic}" class="w-6 h-6 rounded-full object-cover" alt="user">`;
 
@@ -362,6 +499,7 @@ document.addEventListener("DOMContentLoaded", () => {
       }
     };
 
+    // Only used when the browser has no EventSource
     async function refreshCount() {
       try {
         const r = await fetch("/notifications/count");
@@ -373,6 +511,23 @@ document.addEventListener("DOMContentLoaded", () => {
       }
     }
 
+    // Server pushes the badge count whenever it changes; no polling while idle
+    function subscribe() {
+      if (!window.EventSource) {
+        refreshCount();
+        setInterval(refreshCount, 30000);
+        return;
+      }
+      let lastCount = null;
+      const source = new EventSource("/notifications/stream");
+      source.addEventListener("count", (e) => {
+        const { count } = JSON.parse(e.data);
+        setBadge(count || 0);
+        if (lastCount !== null && count !== lastCount && !panel.classList.contains("hidden")) loadList();
+        lastCount = count;
+      });
+    }
+
     function renderItem(it) {
       if (it.type === "friend_request") {
         return `
@@ -417,7 +572,7 @@ document.addEventListener("DOMContentLoaded", () => {
     
       return `
         <div class="px-4 py-3">
-          <p class="text-sm text-[#0c1c17]">New notification</p>
+          <p class="text-sm text-[#0c1c17]">${it.message || "New notification"}</p>
           ${it.created_at ? `
             <p class="text-[11px] text-gray-500">
               <time class="notif-time" datetime="${it.created_at}">${fmtAgo(it.created_at)}</time>
@@ -426,22 +581,33 @@ document.addEventListener("DOMContentLoaded", () => {
     }
     
 
+    // Re-renders the "5m ago" labels while the dropdown is open (local only, no requests)
     let __notifTicker = null; 
+    const stopTicker = () => {
+      if (__notifTicker) { clearInterval(__notifTicker); __notifTicker = null; }
+    };
+
+const moreButton = (cursor) =>
+  `<button class="notif-more w-full px-4 py-2 text-xs font-semibold text-[#019863] hover:bg-[#f2fbf7]" data-cursor="${cursor}">Load more</button>`;
+
+async function fetchPage(before) {
+  const url = before ? `/notifications/list?before=${encodeURIComponent(before)}` : "/notifications/list";
+  const r = await fetch(url);
+  if (!r.ok) throw 0;
+  return r.json();
+}
 
 async function loadList() {
   listEl.innerHTML = `<div class="px-4 py-6 text-sm text-gray-500">Loading…</div>`;
   try {
-    const r = await fetch("/notifications/list");
-    if (!r.ok) throw 0;
-
-    const items = await r.json();
+    const { items, next_cursor } = await fetchPage();
     if (!Array.isArray(items) || items.length === 0) {
       listEl.innerHTML = `<div class="px-4 py-6 text-sm text-gray-500">No new notifications</div>`;
-      if (__notifTicker) { clearInterval(__notifTicker); __notifTicker = null; }
+      stopTicker();
       return;
     }
 
-    listEl.innerHTML = items.map(renderItem).join("");
+    listEl.innerHTML = items.map(renderItem).join("") + (next_cursor ? moreButton(next_cursor) : "");
 
     const tick = () => {
       listEl.querySelectorAll(".notif-time").forEach(t => {
@@ -455,10 +621,26 @@ async function loadList() {
 
   } catch {
     listEl.innerHTML = `<div class="px-4 py-6 text-sm text-red-600">Failed to load notifications.</div>`;
-    if (__notifTicker) { clearInterval(__notifTicker); __notifTicker = null; }
+    stopTicker();
   }
 }
 
+async function loadMore(button) {
+  button.disabled = true;
+  try {
+    const { items, next_cursor } = await fetchPage(button.dataset.cursor);
+    button.insertAdjacentHTML("beforebegin", items.map(renderItem).join(""));
+    if (next_cursor) button.dataset.cursor = next_cursor;
+    else button.remove();
+  } catch {
+    button.disabled = false;
+  }
+  listEl.querySelectorAll(".notif-time").forEach(t => {
+    const iso = t.getAttribute("datetime");
+    if (iso) t.textContent = fmtAgo(iso);
+  });
+}
+
     
 
     async function post(url, body, { asJson = false, asForm = false } = {}) {
@@ -477,6 +659,9 @@ async function loadList() {
     }
 
     listEl.addEventListener("click", async (e) => {
+      const more = e.target.closest(".notif-more");
+      if (more) return loadMore(more);
+
       const item = e.target.closest(".notif-item");
       if (!item) return;
 
@@ -488,10 +673,7 @@ async function loadList() {
       if (kind === "friend") {
         if (isAccept) {
           const ok = await post(`/accept_request/${id}`, null);
-          if (ok) {
-            item.remove();
-            refreshCount();
-          }
+          if (ok) item.remove();
         } else if (isDecline) {
           window.location.href = "/friends";
         }
@@ -503,25 +685,18 @@ async function loadList() {
       if (kind === "ginvite") {
         if (isAccept) {
           const ok = await post("/accept_group_invite", { invite_id: id }, { asJson: true });
-          if (ok) {
-            item.remove();
-            refreshCount();
-          }
+          if (ok) item.remove();
         } else if (isDecline) {
           const ok = await post("/decline_invite", { invite_id: id }, { asForm: true });
-          if (ok) {
-            item.remove();
-            refreshCount();
-          }
+          if (ok) item.remove();
         }
       }
     });
 
     markRead.addEventListener("click", async () => {
       try {
-        await fetch("/notifications/mark-read", { method: "POST" });
+        await fetch("/notifications/mark_read", { method: "POST" });
         panel.classList.add("hidden");
-        refreshCount();
       } catch {}
     });
 
@@ -530,21 +705,22 @@ async function loadList() {
       document.querySelectorAll("#notif-panel").forEach((p) => p !== panel && p.classList.add("hidden"));
       panel.classList.toggle("hidden");
       if (opening) await loadList();
+      else stopTicker();
     });
 
     document.addEventListener("click", (e) => {
       if (!panel.contains(e.target) && e.target !== btn && !btn.contains(e.target)) {
         panel.classList.add("hidden");
+        stopTicker();
       }
     });
 
-    refreshCount();
-    setInterval(refreshCount, 30000);
+    subscribe();
   })();
 
 
   
-  (function formatTransactionTimes() {
+  function formatTransactionTimes(root = document) {
     const fmtOptions = {
       year: "numeric",
       month: "2-digit",
@@ -553,7 +729,9 @@ async function loadList() {
       minute: "2-digit",
       hour12: true,
     };
-    document.querySelectorAll(".transaction-time").forEach((el) => {
+    root.querySelectorAll(".transaction-time").forEach((el) => {
+      if (el.dataset.formatted) return;
+      el.dataset.formatted = "1";
       let iso = el.getAttribute("datetime") || el.textContent || "";
       iso = iso.trim();
       if (iso && !/[zZ]|[+\-]\d{2}:?\d{2}$/.test(iso)) {
@@ -564,7 +742,10 @@ async function loadList() {
         el.textContent = d.toLocaleString(undefined, fmtOptions);
       }
     });
-  })();
+  }
+  formatTransactionTimes();
+  // rows appended by "load more" (static/load_more.js)
+  document.addEventListener("rows-loaded", (e) => formatTransactionTimes(e.detail || document));
 }); 
 
 
@@ -0,0 +1,76 @@
+"""The home page's query count must not grow with the number of groups (no per-group lookups)."""
+import os
+import sys
+
+os.environ["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+os.environ.setdefault("OPENAI_API_KEY", "test")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from sqlalchemy import event, insert
+
+from app import app, _friend_pair
+from models import db, User, Group, GroupMember, Transaction, friendships
+
+
+def _user(name: str) -> User:
+    user = User(full_name=name.title(), username=name, email=f"{name}@example.com", password="x")
+    db.session.add(user)
+    db.session.flush()
+    return user
+
+
+def _user_with_groups(name: str, n_groups: int) -> int:
+    """A user with n_groups groups of three members each, three friends and a payment."""
+    user = _user(name)
+    friends = [_user(f"{name}_friend{i}") for i in range(3)]
+    db.session.execute(insert(friendships), [_friend_pair(user.id, f.id) for f in friends])
+
+    for g in range(n_groups):
+        group = Group(name=f"{name} group {g}", creator_id=user.id, created_by=user.email)
+        db.session.add(group)
+        db.session.flush()
+        db.session.add_all(GroupMember(group_id=group.id, user_id=uid)
+                           for uid in (user.id, friends[0].id, friends[g % 2 + 1].id))
+
+    db.session.add(Transaction(payer=user.full_name, payer_id=user.id, amount=12.5,
+                               date="2026-10-18", description="Lunch"))
+    db.session.commit()
+    return user.id
+
+
+@pytest.fixture
+def client():
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    with app.app_context():
+        db.create_all()
+        yield app.test_client()
+        db.session.remove()
+        db.drop_all()
+
+
+def _home_query_count(client, user_id: int) -> int:
+    with client.session_transaction() as s:
+        s["user_id"] = user_id
+    assert client.get("/").status_code == 200     # warms the per-user caches (notification badge)
+
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", count)
+    try:
+        response = client.get("/")
+    finally:
+        event.remove(db.engine, "before_cursor_execute", count)
+
+    assert response.status_code == 200
+    return len(statements)
+
+
+def test_home_query_count_does_not_grow_with_groups(client):
+    one = _user_with_groups("solo", 1)
+    many = _user_with_groups("busy", 25)
+
+    assert _home_query_count(client, one) == _home_query_count(client, many)
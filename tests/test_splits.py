@@ -0,0 +1,61 @@
+"""An item's shares always add up to its price, exactly, or the split is rejected."""
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from splits import MAX_PRICE, MAX_WEIGHT, SplitError, item_shares, split_bill
+
+
+def _cents(dollars) -> int:
+    return round(dollars * 100)
+
+
+def _random_item(rng: random.Random) -> dict:
+    owners = [f"p{k}" for k in range(rng.randint(1, 6))]
+    price = rng.choice([rng.randint(1, 10_000) / 100, rng.randint(1, MAX_PRICE * 100) / 100])
+    mode = rng.choice(["equal", "shares", "percent", "fixed"])
+    item = {"price": price, "owners": owners, "split": mode}
+    if mode == "shares":
+        item["weights"] = [rng.choice([0, 1, 2, 0.5, 1e6, MAX_WEIGHT]) for _ in owners]
+        item["weights"][0] = item["weights"][0] or 1
+    elif mode == "percent":
+        cuts = sorted(rng.randint(0, 100) for _ in owners[1:])
+        item["weights"] = [b - a for a, b in zip([0] + cuts, cuts + [100])]
+    elif mode == "fixed":
+        item["amounts"] = [None] * len(owners)
+        if len(owners) > 1:
+            item["amounts"][0] = rng.randint(0, _cents(price)) / 100
+    return item
+
+
+def test_shares_add_up_to_the_price():
+    rng = random.Random(16)
+    for _ in range(2000):
+        items = [_random_item(rng) for _ in range(rng.randint(1, 4))]
+        for item, shares in zip(items, item_shares(items)):
+            assert sum(_cents(s) for s in shares) == _cents(item["price"]), item
+
+
+def test_huge_weight_ratio_still_adds_up():
+    split = split_bill("a", [{"price": 1000, "owners": ["b", "c"], "split": "shares", "weights": [MAX_WEIGHT, 1]}])
+    assert split == {"a": -1000.0, "b": 1000.0, "c": 0.0}
+
+    split = split_bill("a", [{"price": MAX_PRICE, "owners": ["b", "c", "d"], "split": "shares",
+                              "weights": [MAX_WEIGHT, 1, 3]}])
+    assert _cents(split["b"]) + _cents(split["c"]) + _cents(split["d"]) == _cents(MAX_PRICE)
+    assert split["a"] == -MAX_PRICE
+
+
+@pytest.mark.parametrize("item", [
+    {"price": 1e17, "owners": ["b", "c"]},
+    {"price": MAX_PRICE + 1, "owners": ["b", "c"]},
+    {"price": 1000, "owners": ["b", "c"], "split": "shares", "weights": [1e12, 1]},
+    {"price": 1000, "owners": ["b", "c"], "split": "fixed", "amounts": [1e17, None]},
+])
+def test_out_of_range_values_are_rejected(item):
+    with pytest.raises(SplitError):
+        split_bill("a", [item])
@@ -0,0 +1,114 @@
+"""
+In-process prefix index for the user autocomplete.
+
+Each worker keeps one sorted list of lowercase keys, "<key>\\x00<user id>", with one key
+for the username and one for every word-start suffix of the full name ("ann kim", "kim").
+A prefix lookup is a bisect to the first key >= q followed by a walk while keys still
+start with q, so "an", "ann k" and "kim" all resolve without touching the database.
+
+Display fields live alongside as plain tuples (full_name, username, profile_pic), so a hit
+can be rendered straight from memory. The index has no idea what's in the database; the
+app decides when it's stale and feeds it rows through load() / upsert().
+"""
+import bisect
+import threading
+
+_SEP = "\x00"
+
+
+def _keys_for(user_id: int, full_name: str | None, username: str | None) -> list[str]:
+    keys = []
+    if username:
+        keys.append(f"{username.lower()}{_SEP}{user_id}")
+    words = (full_name or "").lower().split()
+    for i in range(len(words)):
+        keys.append(f"{' '.join(words[i:])}{_SEP}{user_id}")
+    return keys
+
+
+class UserPrefixIndex:
+    # above this many changed rows, rebuilding the list beats inserting into it one by one
+    REBUILD_THRESHOLD = 1000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys: list[str] = []
+        self._users: dict[int, tuple] = {}
+        self.built = False
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def load(self, rows) -> None:
+        """Replace everything with rows of (id, full_name, username, profile_pic)."""
+        users = {row[0]: tuple(row[1:]) for row in rows}
+        keys = [key for uid, (name, username, _) in users.items() for key in _keys_for(uid, name, username)]
+        keys.sort()
+        with self._lock:
+            self._keys = keys
+            self._users = users
+            self.built = True
+
+    def upsert(self, rows) -> None:
+        """Add new users or re-key renamed ones; rows as for load(). Unchanged rows are skipped."""
+        if not self.built:
+            return     # the first load() reads them anyway
+        with self._lock:
+            rows = [row for row in rows if self._users.get(row[0]) != tuple(row[1:])]
+        if not rows:
+            return
+        if len(rows) > self.REBUILD_THRESHOLD:
+            with self._lock:
+                current = [(uid, *fields) for uid, fields in self._users.items()]
+            merged = {row[0]: row for row in current}
+            merged.update((row[0], tuple(row)) for row in rows)
+            self.load(merged.values())
+            return
+
+        with self._lock:
+            for uid, full_name, username, profile_pic in rows:
+                old = self._users.get(uid)
+                if old is not None:
+                    for key in _keys_for(uid, old[0], old[1]):
+                        i = bisect.bisect_left(self._keys, key)
+                        if i < len(self._keys) and self._keys[i] == key:
+                            del self._keys[i]
+                for key in _keys_for(uid, full_name, username):
+                    bisect.insort(self._keys, key)
+                self._users[uid] = (full_name, username, profile_pic)
+
+    def search(self, q: str, limit: int, exclude_id: int | None = None, first=()) -> list[tuple]:
+        """
+        Up to `limit` users whose username, full name, or any later word of the full name starts
+        with q, as (id, full_name, username, profile_pic). Users in `first` (ids, e.g. the caller's
+        friends) come before everyone else; each group is in key order.
+        """
+        q = " ".join(q.lower().split())
+        if not q:
+            return []
+
+        out: list[tuple] = []
+        seen = {exclude_id}
+        with self._lock:
+            preferred = []
+            for uid in first:
+                fields = self._users.get(uid)
+                if uid in seen or fields is None:
+                    continue
+                matched = [key for key in _keys_for(uid, fields[0], fields[1]) if key.startswith(q)]
+                if matched:
+                    preferred.append((min(matched), uid))
+            for _, uid in sorted(preferred)[:limit]:
+                seen.add(uid)
+                out.append((uid, *self._users[uid]))
+
+            i = bisect.bisect_left(self._keys, q)
+            keys = self._keys
+            while len(out) < limit and i < len(keys) and keys[i].startswith(q):
+                uid = int(keys[i].rpartition(_SEP)[2])
+                i += 1
+                if uid in seen:
+                    continue
+                seen.add(uid)
+                out.append((uid, *self._users[uid]))
+        return out